@@ -0,0 +1,182 @@
+# -------------------------------------------------------------------
+# Batch export of version reports
+# -------------------------------------------------------------------
+# Renders the report for many saved versions at once on the render
+# worker pool and streams the results, in order, into either
+# - a zip archive with one PDF per version, or
+# - a single multi-page PDF (one page per version).
+# Workers read the version files themselves (and build each PDF of a zip
+# export), so the caller never parses them. A version that cannot be read
+# or rendered is skipped and reported; the rest of the batch goes on. Used by the Versions tab and as a command-line tool:
+#
+#   python batch_export.py --output reports.zip
+#   python batch_export.py --output reports.pdf --highlights "Q3 review" a.geojson b.geojson
+import argparse
+import io
+import os
+import sys
+import time
+import zipfile
+
+from collections import deque
+
+from render_service import (
+    PDF_EXPORT_SETTINGS,
+    PRIORITY_BATCH,
+    RenderService,
+    add_report_page,
+    new_report_document,
+    render_version_file_pdf,
+    render_version_file_snapshot,
+)
+from version_store import is_version_file
+
+VERSION_FOLDER = "data/output/"
+DEFAULT_COLOR = "#B58264"  # PRIMARY_COLOR in main_0.py
+EXPORT_FORMATS = ("zip", "pdf")
+
+
+def export_format_for(output):
+    """
+    'zip' or 'pdf' from an output file name.
+    """
+    extension = os.path.splitext(str(output))[1].lower().lstrip(".")
+    if extension not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{extension}' (use .zip or .pdf).")
+    return extension
+
+
+def _rendered_in_order(service, version_paths, job, window, timeout):
+    """
+    Yield (version_path, result, error) in input order while keeping at
+    most `window` jobs submitted ahead of the consumer. job(path) returns
+    (fn, *args) for the worker; a job that fails yields its exception as
+    error (and None as result) instead of ending the batch.
+    """
+    pending = deque()
+    paths = iter(version_paths)
+    while True:
+        while len(pending) < window:
+            path = next(paths, None)
+            if path is None:
+                break
+            pending.append((path, service.submit(*job(path), priority=PRIORITY_BATCH, timeout=timeout)))
+        if not pending:
+            return
+        path, future = pending.popleft()
+        try:
+            yield path, future.result(), None
+        except Exception as e:
+            yield path, None, e
+
+
+def export_versions(version_paths, output, export_format="zip", highlights="", service=None,
+                    workers=None, on_progress=None, timeout=None):
+    """
+    Render reports for version_paths into output (a path or a binary
+    file object) as a zip of PDFs or one multi-page PDF.
+    - service: a running RenderService (default: a temporary pool with
+      `workers` processes, shut down afterwards).
+    - on_progress(done, total): called after each version is written
+      or skipped.
+    Returns stats: versions (exported), skipped ([(version name, error
+    message)]), seconds, versions_per_second, bytes.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{export_format}' (use 'zip' or 'pdf').")
+    version_paths = list(version_paths)
+    own_service = service is None
+    if own_service:
+        service = RenderService(workers or os.cpu_count() or 1)
+
+    if export_format == "zip":
+        def job(path):
+            return (render_version_file_pdf, path, os.path.basename(path), highlights, DEFAULT_COLOR,
+                    PDF_EXPORT_SETTINGS["snapshot_title"], PDF_EXPORT_SETTINGS["figsize"])
+    else:
+        def job(path):
+            return (render_version_file_snapshot, path, DEFAULT_COLOR,
+                    PDF_EXPORT_SETTINGS["snapshot_title"], PDF_EXPORT_SETTINGS["figsize"])
+
+    skipped = []
+    started = time.perf_counter()
+    try:
+        window = max(1, min(service.max_queue, 2 * service.workers))
+        rendered = _rendered_in_order(service, version_paths, job, window, timeout)
+
+        if export_format == "zip":
+            with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED) as archive:
+                for done, (path, pdf, error) in enumerate(rendered, start=1):
+                    version_name = os.path.basename(path)
+                    if error is None:
+                        archive.writestr(f"redistricting_report_{version_name}.pdf", pdf)
+                    else:
+                        skipped.append((version_name, f"{type(error).__name__}: {error}"))
+                    if on_progress:
+                        on_progress(done, len(version_paths))
+        else:
+            document = new_report_document()
+            for done, (path, png, error) in enumerate(rendered, start=1):
+                version_name = os.path.basename(path)
+                if error is None:
+                    add_report_page(document, io.BytesIO(png), version_name, highlights)
+                else:
+                    skipped.append((version_name, f"{type(error).__name__}: {error}"))
+                if on_progress:
+                    on_progress(done, len(version_paths))
+            data = bytes(document.output())
+            if hasattr(output, "write"):
+                output.write(data)
+            else:
+                with open(output, "wb") as file:
+                    file.write(data)
+    finally:
+        if own_service:
+            service.shutdown()
+
+    seconds = time.perf_counter() - started
+    size = output.tell() if hasattr(output, "tell") else os.path.getsize(output)
+    exported = len(version_paths) - len(skipped)
+    return {
+        "versions": exported,
+        "skipped": skipped,
+        "seconds": seconds,
+        "versions_per_second": exported / seconds if seconds else 0.0,
+        "bytes": size,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export version reports as a zip of PDFs or one multi-page PDF.")
+    parser.add_argument("versions", nargs="*", help="Version files (default: every version in --folder).")
+    parser.add_argument("--folder", default=VERSION_FOLDER, help="Folder with saved versions.")
+    parser.add_argument("--output", required=True, help="Output file, .zip or .pdf.")
+    parser.add_argument("--highlights", default="", help="Comments printed on every page.")
+    parser.add_argument("--workers", type=int, default=None, help="Render processes (default: CPU count).")
+    args = parser.parse_args(argv)
+
+    version_paths = args.versions or sorted(
+        os.path.join(args.folder, name) for name in os.listdir(args.folder) if is_version_file(name)
+    )
+    if not version_paths:
+        parser.error(f"No versions found in {args.folder}.")
+
+    stats = export_versions(
+        version_paths,
+        args.output,
+        export_format_for(args.output),
+        highlights=args.highlights,
+        workers=args.workers,
+        on_progress=lambda done, total: print(f"\r{done}/{total} versions", end="", file=sys.stderr),
+    )
+    print(file=sys.stderr)
+    for version_name, message in stats["skipped"]:
+        print(f"Skipped {version_name}: {message}", file=sys.stderr)
+    print(
+        f"Exported {stats['versions']} versions to {args.output} ({stats['bytes'] / 1024:.0f} KB) "
+        f"in {stats['seconds']:.1f}s: {stats['versions_per_second']:.2f} versions/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# -------------------------------------------------------------------
+# Shared setup for the benchmark scripts
+# -------------------------------------------------------------------
+# Run the scripts from anywhere, e.g. `python benchmarks/bench_save.py`:
+# importing this module puts the repository on sys.path and makes it the
+# working directory, so the app's relative data paths resolve.
+# Helpers that live in the Streamlit script (main_0.py) are loaded with
+# app_definitions(), without running the app itself.
+import ast
+import os
+import sys
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+os.chdir(REPO)
+
+COUNTIES_FILE = "data/input/counties_0.geojson"
+ZIP_CODE_FILE = "data/input/zip_codes_0.geojson"
+JOINT_FILE = "data/input/joint_0.geojson"
+
+
+def best_of(fn, repeat=3):
+    """
+    (fastest wall time in seconds, last result) over `repeat` calls.
+    """
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def app_definitions(*names):
+    """
+    Namespace with main_0.py's imports and settings (everything above the
+    "Main Script" section that is not a function or class) plus the named
+    functions and classes.
+    """
+    with open(os.path.join(REPO, "main_0.py"), encoding="utf-8") as file:
+        source = file.read()
+    main_line = source[: source.index("# Main Script")].count("\n") + 1
+    nodes = [
+        node for node in ast.parse(source).body
+        if (node.lineno < main_line and isinstance(node, (ast.Import, ast.ImportFrom, ast.Assign)))
+        or (isinstance(node, (ast.FunctionDef, ast.ClassDef)) and node.name in names)
+    ]
+    missing = set(names) - {node.name for node in nodes if hasattr(node, "name")}
+    if missing:
+        raise NameError(f"Not defined in main_0.py: {', '.join(sorted(missing))}")
+    namespace = {"__name__": "main_0"}
+    exec(compile(ast.Module(nodes, type_ignores=[]), "main_0.py", "exec"), namespace)
+    return namespace
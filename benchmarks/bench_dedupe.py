@@ -0,0 +1,52 @@
+"""
+Key-based feature dedupe (dedupe_features in main_0.py) against the
+groupby("geometry") aggregation it replaced, on Texas and on the full
+national layer ("All").
+
+    python benchmarks/bench_dedupe.py
+
+Each run first checks that both paths produce identical frames.
+"""
+import geopandas as gpd
+
+from _common import COUNTIES_FILE, app_definitions, best_of
+
+app = app_definitions("dedupe_features", "feature_keys")
+
+
+def groupby_geometry(gdf):
+    """
+    The previous Main-tab path: group rows by their geometry objects and
+    aggregate every group with Python lambdas.
+    """
+    result = gdf.groupby("geometry", as_index=False).agg({
+        "STATEFP": lambda x: list(filter(None, set(x))),
+        "NAME": "first",
+        "SalesRep": "first",
+        "Product": "first",
+        "color": "first",
+        "geometry": "first",
+    })
+    return gpd.GeoDataFrame(result, geometry="geometry", crs=gdf.crs)
+
+
+def main():
+    counties = gpd.read_file(COUNTIES_FILE)
+    counties["SalesRep"] = None
+    counties["Product"] = None
+    counties["color"] = app["PRIMARY_COLOR"]
+
+    print(f"{'view':6s} {'features':>8s} {'groupby':>9s} {'by key':>8s} {'speedup':>8s}  identical")
+    for view, gdf in (("48", counties[counties["STATEFP"] == "48"]), ("All", counties)):
+        old_seconds, old = best_of(lambda: groupby_geometry(gdf))
+        new_seconds, new = best_of(lambda: app["dedupe_features"](gdf))
+        identical = new.equals(old)
+        assert identical, f"dedupe_features differs from groupby('geometry') for {view}"
+        print(
+            f"{view:6s} {len(new):8d} {old_seconds * 1000:7.0f}ms {new_seconds * 1000:6.0f}ms "
+            f"{old_seconds / new_seconds:7.1f}x  {identical}"
+        )
+
+
+if __name__ == "__main__":
+    main()
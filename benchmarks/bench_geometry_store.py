@@ -0,0 +1,94 @@
+"""
+Disk usage and load time of 100 synthetic saved versions, as whole
+GeoJSON files (the layout before delta versions) and as delta versions
+over the content-addressed geometry store (geometry_store.py).
+
+    python benchmarks/bench_geometry_store.py
+
+Versions are built like the Main tab saves them: a state view (or the
+whole layer) plus 1-5 drawn squares, with a few counties recolored.
+Everything is written to a temporary folder.
+"""
+import glob
+import os
+import random
+import tempfile
+
+import geopandas as gpd
+
+from shapely.geometry import box
+
+from _common import COUNTIES_FILE, app_definitions, best_of
+from geo_cache import read_geojson_cached
+from version_store import load_base, read_version, write_delta_version_atomic, write_geojson_atomic
+
+VERSIONS = 100
+
+app = app_definitions("merge_proposed_territories")
+
+
+def synthetic_versions(full, count, seed=1):
+    rng = random.Random(seed)
+    states = sorted(full["STATEFP"].unique())
+    for i in range(count):
+        state = "All" if rng.random() < 0.2 else rng.choice(states)
+        view = full if state == "All" else full[full["STATEFP"] == state]
+        minx, miny, maxx, maxy = view.total_bounds
+        pending = []
+        for _ in range(rng.randint(1, 5)):
+            x, y = rng.uniform(minx, maxx), rng.uniform(miny, maxy)
+            pending.append((box(x, y, x + 0.5, y + 0.5), f"#{rng.randrange(1 << 24):06x}"))
+        touched = {state} if state != "All" else {rng.choice(states)}
+        statefp = None if state == "All" else state
+        version = app["merge_proposed_territories"](
+            view, full, pending, touched, [statefp] * len(pending), ["X (Proposed)"] * len(pending)
+        )
+        for row in rng.sample(range(len(version)), min(10, len(version))):
+            version.loc[row, "color"] = f"#{rng.randrange(1 << 24):06x}"
+        yield f"v{i:03d}_20250101_{i:06d}", version
+
+
+def folder_size(folder):
+    return sum(os.path.getsize(path) for path in glob.glob(f"{folder}/**", recursive=True) if os.path.isfile(path))
+
+
+def load_all(files, read):
+    """
+    (ms for the first version, ms per version for the rest, total rows)
+    """
+    first_seconds, first = best_of(lambda: read(files[0]), repeat=1)
+    rest_seconds, rows = best_of(lambda: sum(len(read(path)) for path in files[1:]), repeat=1)
+    return first_seconds * 1000, rest_seconds * 1000 / max(len(files) - 1, 1), rows + len(first)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as root:
+        cache_folder = os.path.join(root, "cache")
+        full = read_geojson_cached(COUNTIES_FILE, cache_folder=cache_folder)
+        full["color"] = app["PRIMARY_COLOR"]
+        for layout in ("geojson", "store"):
+            os.makedirs(os.path.join(root, layout))
+        for name, version in synthetic_versions(full, VERSIONS):
+            write_geojson_atomic(version, os.path.join(root, "geojson", f"{name}.geojson"))
+            write_delta_version_atomic(
+                version, os.path.join(root, "store", f"{name}.delta.json"), COUNTIES_FILE, cache_folder=cache_folder
+            )
+
+        layouts = {
+            "geojson": (sorted(glob.glob(f"{root}/geojson/*.geojson")), gpd.read_file),
+            "store": (sorted(glob.glob(f"{root}/store/*.delta.json")), read_version),
+        }
+        load_base.cache_clear()
+        print(f"{VERSIONS} versions")
+        print(f"{'layout':8s} {'disk':>9s} {'first load':>11s} {'next loads':>16s}")
+        for layout, (files, read) in layouts.items():
+            first_ms, next_ms, rows = load_all(files, read)
+            print(
+                f"{layout:8s} {folder_size(os.path.join(root, layout)) / 1e6:6.2f} MB {first_ms:8.0f} ms "
+                f"{next_ms:8.1f} ms/version ({rows} rows)"
+            )
+        load_base.cache_clear()
+
+
+if __name__ == "__main__":
+    main()
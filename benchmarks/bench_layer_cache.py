@@ -0,0 +1,37 @@
+"""
+Cold vs warm layer loads through the columnar cache (geo_cache.py).
+
+    python benchmarks/bench_layer_cache.py
+
+- read_file: parsing the GeoJSON text, what every load cost before
+- cold: first read_geojson_cached call (parse + write the GeoParquet copy)
+- warm: later calls, served from the copy
+A temporary cache folder is used, so data/cache/ is left alone. Warm
+reads include a fixed ~35 ms for pyproj to parse the stored CRS, so small
+layers (joint_0) gain nothing; the saving grows with the layer.
+"""
+import os
+import tempfile
+
+import geopandas as gpd
+
+from _common import COUNTIES_FILE, JOINT_FILE, ZIP_CODE_FILE, best_of
+from geo_cache import read_geojson_cached
+
+
+def main():
+    print(f"{'layer':22s} {'features':>8s} {'read_file':>10s} {'cold':>8s} {'warm':>8s} {'speedup':>8s}")
+    for file_path in (COUNTIES_FILE, ZIP_CODE_FILE, JOINT_FILE):
+        with tempfile.TemporaryDirectory() as cache_folder:
+            parse, gdf = best_of(lambda: gpd.read_file(file_path))
+            cold, _ = best_of(lambda: read_geojson_cached(file_path, cache_folder=cache_folder), repeat=1)
+            warm, cached = best_of(lambda: read_geojson_cached(file_path, cache_folder=cache_folder), repeat=5)
+            assert cached.equals(gdf), f"cached copy of {file_path} differs from the source"
+        print(
+            f"{os.path.basename(file_path):22s} {len(gdf):8d} {parse * 1000:8.0f}ms {cold * 1000:6.0f}ms "
+            f"{warm * 1000:6.0f}ms {parse / warm:7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+"Save Proposed Territories": the per-polygon loop it used to run against
+merge_proposed_territories (main_0.py), which merges all drawn polygons in
+one pass, for sessions with 1 to 300 drawn territories in Texas.
+
+    python benchmarks/bench_save.py
+
+Each run also checks that both paths build the same frame.
+"""
+import geopandas as gpd
+import pandas as pd
+
+from shapely.geometry import box
+
+from _common import COUNTIES_FILE, app_definitions, best_of
+
+app = app_definitions("merge_proposed_territories")
+PRIMARY_COLOR = app["PRIMARY_COLOR"]
+
+
+def per_polygon_loop(filtered_gdf, full_gdf, pending_polygons, states_with_proposed, statefps, proposed_names):
+    """
+    The previous save path: re-merge the states with proposals and append
+    a one-row frame for every drawn polygon (quadratic in their number).
+    """
+    final_gdf = filtered_gdf.copy()
+    for (poly, color), statefp, name in zip(pending_polygons, statefps, proposed_names):
+        if states_with_proposed:
+            updated_states_gdf = full_gdf[full_gdf["STATEFP"].isin(states_with_proposed)]
+            final_gdf = pd.concat([final_gdf, updated_states_gdf]).drop_duplicates(
+                subset=["STATEFP", "NAME", "geometry"]
+            ).reset_index(drop=True)
+            mask_updated = final_gdf["STATEFP"].isin(states_with_proposed)
+            mask_proposed = final_gdf["NAME"].str.endswith("(Proposed)", na=False)
+            final_gdf.loc[mask_updated & ~mask_proposed, "color"] = PRIMARY_COLOR
+        new_row = gpd.GeoDataFrame(
+            {"STATEFP": [statefp], "NAME": [name], "color": [color], "geometry": [poly]}, crs=final_gdf.crs
+        )
+        final_gdf = pd.concat([final_gdf, new_row], ignore_index=True)
+    return final_gdf
+
+
+def main():
+    full = gpd.read_file(COUNTIES_FILE)
+    full["color"] = "#123456"
+    filtered = full[full["STATEFP"] == "48"]
+
+    print(f"{'polygons':>8s} {'loop':>10s} {'batched':>9s}  identical")
+    for count in (1, 10, 100, 300):
+        pending = [(box(-100 + i * 0.01, 30, -99.99 + i * 0.01, 30.01), f"#{i:06x}") for i in range(count)]
+        args = (filtered, full, pending, {"48"}, ["48"] * count, ["Harris (Proposed)"] * count)
+        old_seconds, old = best_of(lambda: per_polygon_loop(*args), repeat=1 if count > 100 else 3)
+        new_seconds, new = best_of(lambda: app["merge_proposed_territories"](*args))
+        identical = (
+            list(old.columns) == list(new.columns)
+            and old.drop(columns="geometry").equals(new.drop(columns="geometry"))
+            and bool(old.geometry.geom_equals_exact(new.geometry, 0).all())
+        )
+        assert identical, f"merge_proposed_territories differs from the loop for {count} polygons"
+        print(f"{count:8d} {old_seconds * 1000:8.0f}ms {new_seconds * 1000:7.0f}ms  {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Snapshot rendering: GeoDataFrame.plot (one patch per polygon) against
+draw_polygons (one PathCollection for the layer), with and without
+pixel-aware simplification, on counties_0 and zip_codes_0.
+
+    python benchmarks/bench_snapshot.py
+
+Also reports the share of pixels that differ noticeably from the
+GeoDataFrame.plot image.
+"""
+import io
+import os
+
+import matplotlib.image as mpimg
+import numpy as np
+import geopandas as gpd
+
+from matplotlib.figure import Figure
+
+from _common import COUNTIES_FILE, ZIP_CODE_FILE, best_of
+from render_service import draw_polygons
+
+MODES = {
+    "plot": None,
+    "collection": None,  # draw_polygons, full detail
+    "collection, simplified": 0.5,  # draw_polygons, simplified to half a pixel
+}
+
+
+def snapshot(gdf, mode):
+    """
+    PNG bytes of the layer drawn as generate_map_snapshot does (fixed
+    canvas, so images of different modes line up pixel for pixel).
+    """
+    fig = Figure(figsize=(8, 6))
+    ax = fig.subplots()
+    if mode == "plot":
+        gdf.plot(ax=ax, edgecolor="black", color=gdf["color"], alpha=0.6)
+    else:
+        ax.set_aspect("equal")
+        draw_polygons(ax, gdf, gdf["color"], pixel_tolerance=MODES[mode])
+    ax.axis("off")
+    # (GeoDataFrame.plot sets a latitude-corrected aspect; snapshots use 1:1)
+    ax.set_aspect("equal")
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
+
+
+def main():
+    for file_path in (COUNTIES_FILE, ZIP_CODE_FILE):
+        gdf = gpd.read_file(file_path)
+        gdf["color"] = np.random.default_rng(0).choice(["#B58264", "#3A052E", "#4477aa"], len(gdf))
+        print(f"{os.path.basename(file_path)} ({len(gdf)} features)")
+
+        images = {}
+        for mode in MODES:
+            seconds, png = best_of(lambda: snapshot(gdf, mode))
+            images[mode] = mpimg.imread(io.BytesIO(png))[..., :3]
+            changed = np.abs(images[mode] - images["plot"]).max(axis=2) > 0.1
+            print(f"  {mode:24s} {seconds * 1000:6.0f} ms   pixels differing >10%: {changed.mean() * 100:5.2f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# -------------------------------------------------------------------
+# County spatial index
+# -------------------------------------------------------------------
+# Answers "which counties does this drawn territory cover, and how much of
+# each" without scanning the county layer. Counties are projected once to
+# an equal-area CRS and put in a shapely STRtree; a batch of drawn
+# polygons is then matched against it in one bulk query, and every
+# (polygon, county) overlap is measured in one vectorized intersection.
+# Areas are compared in the equal-area projection, so percentages are
+# true shares of ground area rather than of square degrees.
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+AREA_CRS = "EPSG:5070"  # NAD83 / Conus Albers (equal-area)
+COVERAGE_COLUMNS = ["polygon", "GEOID", "NAME", "STATEFP", "area_km2", "county_pct", "territory_pct"]
+
+
+class CountyIndex:
+    """
+    STRtree over a county layer, built once per dataset.
+    - coverage(polygons) -> counties intersecting each polygon, with the
+      share of the county covered and the share of the polygon inside it
+    - main_counties(coverage, count) -> the county holding most of each
+      polygon
+    Polygons are expected in the layer's CRS.
+    """
+
+    def __init__(self, gdf, area_crs=AREA_CRS):
+        self.crs = gdf.crs
+        self._area_crs = area_crs if gdf.crs is not None else None
+        geometries = gdf.geometry if self._area_crs is None else gdf.geometry.to_crs(self._area_crs)
+        self._geometries = np.asarray(geometries.values, dtype=object)
+        self._areas = shapely.area(self._geometries)
+        self._tree = shapely.STRtree(self._geometries)
+        self._attributes = {
+            col: gdf[col].astype(object).to_numpy() if col in gdf.columns else np.full(len(gdf), None, dtype=object)
+            for col in ["GEOID", "NAME", "STATEFP"]
+        }
+
+    def __len__(self):
+        return len(self._geometries)
+
+    def _project(self, polygons):
+        if self._area_crs is None:
+            return polygons
+        return np.asarray(gpd.GeoSeries(polygons, crs=self.crs).to_crs(self._area_crs).values, dtype=object)
+
+    def coverage(self, polygons):
+        """
+        One row per (polygon, county) pair sharing some area:
+        - polygon: position of the drawn polygon in polygons
+        - GEOID, NAME, STATEFP of the county
+        - area_km2: area of the overlap
+        - county_pct: percent of the county's area covered by the polygon
+        - territory_pct: percent of the polygon's area inside the county
+        Rows are ordered by polygon, then by territory_pct (largest first).
+        """
+        polygons = shapely.make_valid(np.asarray(polygons, dtype=object))
+        if not len(polygons):
+            return pd.DataFrame({col: pd.Series(dtype=object) for col in COVERAGE_COLUMNS})
+
+        projected = self._project(polygons)
+        polygon_idx, county_idx = self._tree.query(projected, predicate="intersects")
+        overlap = shapely.area(shapely.intersection(projected[polygon_idx], self._geometries[county_idx]))
+        polygon_areas = shapely.area(projected)[polygon_idx]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            coverage = pd.DataFrame({
+                "polygon": polygon_idx,
+                **{col: values[county_idx] for col, values in self._attributes.items()},
+                "area_km2": overlap / 1e6,
+                "county_pct": 100 * overlap / self._areas[county_idx],
+                "territory_pct": np.where(polygon_areas > 0, 100 * overlap / polygon_areas, 0.0),
+            })
+        # Boundary-only contacts intersect but cover nothing
+        coverage = coverage[overlap > 0]
+        return coverage.sort_values(["polygon", "territory_pct"], ascending=[True, False], kind="stable").reset_index(
+            drop=True
+        )
+
+    @staticmethod
+    def main_counties(coverage, count):
+        """
+        NAME and STATEFP of the county holding the largest share of each of
+        count polygons (None for polygons outside every county).
+        """
+        first = coverage.drop_duplicates("polygon").set_index("polygon")[["NAME", "STATEFP"]]
+        main = first.reindex(range(count)).astype(object)
+        return main.where(main.notna(), None)
@@ -0,0 +1,111 @@
+# -------------------------------------------------------------------
+# Bounded on-disk cache for generated exports (map snapshots, PDFs)
+# -------------------------------------------------------------------
+# Exports are pure functions of their inputs: the version file's content,
+# the user's highlights text and the render settings. Those inputs are
+# hashed into a key; the first request for a key builds the export and
+# stores it, later requests read the stored bytes. Entries are evicted
+# least-recently-used (by file mtime, refreshed on every hit) once the
+# cache exceeds its size or entry budget.
+import hashlib
+import json
+import os
+import threading
+
+EXPORT_CACHE_FOLDER = "data/cache/exports/"
+EXPORT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+EXPORT_CACHE_MAX_ENTRIES = 500
+
+
+def file_digest(file_path, chunk_size=1024 * 1024):
+    """
+    SHA-256 of a file's contents (hex).
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_key(kind, *parts):
+    """
+    Cache key for an export of the given kind (e.g. 'pdf') from its inputs.
+    Parts must be JSON-serializable (strings, numbers, lists, dicts).
+    """
+    payload = json.dumps([kind, *parts], sort_keys=True, separators=(",", ":"))
+    return f"{kind}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]}"
+
+
+def cached_export_path(key, suffix, cache_folder=EXPORT_CACHE_FOLDER):
+    return os.path.join(cache_folder, f"{key}.{suffix}")
+
+
+def read_cached_export(key, suffix, cache_folder=EXPORT_CACHE_FOLDER):
+    """
+    Stored bytes for key, or None on a miss. A hit refreshes the entry's
+    mtime so it is evicted last.
+    """
+    path = cached_export_path(key, suffix, cache_folder)
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+        os.utime(path)
+        return data
+    except OSError:
+        return None
+
+
+def cached_export(key, suffix, build, cache_folder=EXPORT_CACHE_FOLDER,
+                  max_bytes=EXPORT_CACHE_MAX_BYTES, max_entries=EXPORT_CACHE_MAX_ENTRIES):
+    """
+    Bytes of the export for key: read from the cache, or produced by
+    build() (returning bytes) and stored atomically. A failed write never
+    blocks the export; the built bytes are returned anyway.
+    """
+    data = read_cached_export(key, suffix, cache_folder)
+    if data is not None:
+        return data
+
+    data = build()
+    path = cached_export_path(key, suffix, cache_folder)
+    temp_file = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(cache_folder, exist_ok=True)
+        with open(temp_file, "wb") as file:
+            file.write(data)
+        os.replace(temp_file, path)
+        prune_exports(cache_folder, max_bytes, max_entries)
+    except OSError:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+    return data
+
+
+def prune_exports(cache_folder=EXPORT_CACHE_FOLDER, max_bytes=EXPORT_CACHE_MAX_BYTES,
+                  max_entries=EXPORT_CACHE_MAX_ENTRIES):
+    """
+    Delete least-recently-used entries until the cache fits both budgets.
+    """
+    entries = []
+    for name in os.listdir(cache_folder):
+        if name.endswith(".tmp"):
+            continue
+        path = os.path.join(cache_folder, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+    entries.sort(reverse=True)
+    total = 0
+    for count, (_, size, path) in enumerate(entries, start=1):
+        total += size
+        if count > max_entries or total > max_bytes:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
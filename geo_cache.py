@@ -0,0 +1,189 @@
+# -------------------------------------------------------------------
+# Columnar on-disk cache for GeoJSON layers
+# -------------------------------------------------------------------
+# Text GeoJSON is slow to parse. The first read of a source file writes a
+# GeoParquet copy (WKB geometry) to the cache folder; later reads are served
+# from that copy for as long as the source file's mtime and size match.
+#
+# The same cache folder also holds level-of-detail pyramids: simplified
+# copies of a layer's geometry for low zoom levels.
+import hashlib
+import math
+import os
+import threading
+
+import geopandas as gpd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+
+CACHE_FOLDER = "data/cache/"
+
+# Zoom levels with a precomputed simplified geometry; above the last one
+# the full-resolution geometry is used
+LOD_ZOOMS = (4, 6, 8)
+
+
+def source_signature(file_path):
+    """
+    Cheap change detector for a source file: modification time (ns) + size.
+    """
+    stat = os.stat(file_path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def cache_path_prefix(file_path, cache_folder=CACHE_FOLDER):
+    """
+    Stable per-source prefix, e.g. 'data/cache/counties_0-1a2b3c4d5e6f'.
+    The absolute path is hashed so same-named files in different folders
+    never share cache entries.
+    """
+    abs_path = os.path.abspath(file_path)
+    path_hash = hashlib.sha1(abs_path.encode("utf-8")).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(cache_folder, f"{stem}-{path_hash}")
+
+
+def cache_file_for(file_path, suffix="parquet", cache_folder=CACHE_FOLDER):
+    """
+    Cache file name for the current version of the source file.
+    """
+    prefix = cache_path_prefix(file_path, cache_folder)
+    return f"{prefix}-{source_signature(file_path)}.{suffix}"
+
+
+def remove_stale_entries(file_path, current, suffix="parquet", cache_folder=CACHE_FOLDER):
+    """
+    Delete cache files of the same kind (suffix) written for older versions
+    of the source file.
+    """
+    prefix = os.path.basename(cache_path_prefix(file_path, cache_folder)) + "-"
+    if not os.path.isdir(cache_folder):
+        return
+    for name in os.listdir(cache_folder):
+        path = os.path.join(cache_folder, name)
+        _, _, name_suffix = name[len(prefix):].partition(".")
+        if name.startswith(prefix) and name_suffix == suffix and path != current:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def read_geojson_cached(file_path, cache_folder=CACHE_FOLDER):
+    """
+    Read a GeoJSON file, going through the columnar cache.
+    - Cache hit: read the GeoParquet copy.
+    - Cache miss: parse the GeoJSON, then write the copy atomically.
+    Cache failures never block the read; the parsed frame is returned anyway.
+    """
+    cache_file = cache_file_for(file_path, cache_folder=cache_folder)
+    if os.path.exists(cache_file):
+        try:
+            return gpd.read_parquet(cache_file)
+        except Exception:
+            # Corrupt or unreadable copy: fall through and rebuild it
+            pass
+
+    gdf = gpd.read_file(file_path)
+
+    temp_file = f"{cache_file}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(cache_folder, exist_ok=True)
+        gdf.to_parquet(temp_file, index=False)
+        os.replace(temp_file, cache_file)
+        remove_stale_entries(file_path, cache_file, cache_folder=cache_folder)
+    except Exception:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+
+    return gdf
+
+
+# -------------------------------------------------------------------
+# Level-of-detail pyramid
+# -------------------------------------------------------------------
+def lod_tolerance(zoom):
+    """
+    Simplification tolerance (degrees) for a zoom level: half the width of
+    one 256px web-map tile pixel at that zoom.
+    """
+    return 180.0 / (256 * 2 ** zoom)
+
+
+def fitted_zoom(bounds, width_px, height_px, max_zoom=18):
+    """
+    Zoom level Leaflet's fitBounds picks for [[south, west], [north, east]]
+    in a width_px x height_px map: the largest whole zoom at which the box,
+    in Web Mercator pixels, fits the map.
+    """
+    (south, west), (north, east) = bounds
+
+    def mercator_y(lat):
+        lat = math.radians(max(min(lat, 85.0511), -85.0511))
+        return math.log(math.tan(math.pi / 4 + lat / 2))
+
+    # Size of the box in pixels at zoom 0 (the world is 256px wide)
+    dx = (east - west) / 360.0 * 256
+    dy = (mercator_y(north) - mercator_y(south)) / (2 * math.pi) * 256
+    scales = [size / extent for size, extent in ((width_px, dx), (height_px, dy)) if extent > 0]
+    if not scales:
+        return max_zoom
+    return int(min(max(math.floor(math.log2(min(scales))), 0), max_zoom))
+
+
+def lod_level_for_zoom(zoom):
+    """
+    Pyramid level to draw at a given map zoom (None = full resolution).
+    """
+    levels = [z for z in LOD_ZOOMS if z >= zoom]
+    return levels[0] if levels else None
+
+
+def build_lod_pyramid(geometries, zooms=LOD_ZOOMS):
+    """
+    Simplified geometry arrays, one per zoom level. Each geometry is
+    simplified with preserve_topology=True, so rings stay valid and never
+    collapse; the outline error stays below half a pixel at that zoom.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    return {z: shapely.simplify(geometries, lod_tolerance(z), preserve_topology=True) for z in zooms}
+
+
+def read_lod_pyramid_cached(file_path, geometries, cache_folder=CACHE_FOLDER):
+    """
+    LOD pyramid for the geometries loaded from file_path, cached next to
+    the columnar copy as one WKB column per level. The geometries must be
+    in file order (as returned by read_geojson_cached).
+    """
+    cache_file = cache_file_for(file_path, suffix="lod.parquet", cache_folder=cache_folder)
+    if os.path.exists(cache_file):
+        try:
+            table = pq.read_table(cache_file)
+            if table.num_rows == len(geometries):
+                return {
+                    int(name[1:]): shapely.from_wkb(table.column(name).to_numpy(zero_copy_only=False))
+                    for name in table.column_names
+                }
+        except Exception:
+            pass
+
+    pyramid = build_lod_pyramid(geometries)
+
+    temp_file = f"{cache_file}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(cache_folder, exist_ok=True)
+        table = pa.table({f"z{z}": shapely.to_wkb(level) for z, level in pyramid.items()})
+        pq.write_table(table, temp_file)
+        os.replace(temp_file, cache_file)
+        remove_stale_entries(file_path, cache_file, suffix="lod.parquet", cache_folder=cache_folder)
+    except Exception:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+
+    return pyramid
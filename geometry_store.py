@@ -0,0 +1,125 @@
+# -------------------------------------------------------------------
+# Content-addressed geometry store
+# -------------------------------------------------------------------
+# Saved versions repeat the same county polygons over and over. The store
+# keeps each distinct geometry once, as WKB in a SQLite table keyed by a
+# hash of that WKB; version files and base snapshots hold only the keys.
+# Parsed geometries are shared by key (shapely geometries are immutable)
+# through weak references: versions loaded together share the same
+# objects, and a geometry is parsed again only once no loaded frame holds
+# it. The store itself never keeps geometries alive, so memory stays
+# within what the version cache (version_cache.py) budgets for.
+import contextlib
+import hashlib
+import os
+import sqlite3
+import threading
+import weakref
+
+import numpy as np
+import shapely
+
+GEOMETRY_STORE_FILE = "geometries.sqlite"
+SQLITE_MAX_PARAMS = 900  # keys per IN (...) query
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS geometries (
+    key TEXT PRIMARY KEY,   -- BLAKE2b-128 of the WKB (hex)
+    wkb BLOB NOT NULL
+);
+"""
+
+
+def geometry_key(wkb):
+    return hashlib.blake2b(wkb, digest_size=16).hexdigest()
+
+
+class GeometryStore:
+    """
+    SQLite-backed geometry store with a weak-valued map of the parsed
+    geometries currently in use.
+    - put(geometries) -> keys (stores the ones not stored yet)
+    - get(keys) -> object array of geometries, in key order
+    Missing geometries (None) get the key None and are never stored.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._cache = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _remember(self, keys, geometries):
+        with self._lock:
+            for key, geometry in zip(keys, geometries):
+                self._cache[key] = geometry
+
+    def put(self, geometries):
+        geometries = np.asarray(geometries, dtype=object)
+        blobs = shapely.to_wkb(geometries)
+        keys = [None if wkb is None else geometry_key(wkb) for wkb in blobs]
+        rows = {key: wkb for key, wkb in zip(keys, blobs) if key is not None}
+        with self._connect() as db:
+            db.executemany("INSERT OR IGNORE INTO geometries (key, wkb) VALUES (?, ?)", rows.items())
+        present = [key is not None for key in keys]
+        self._remember(np.asarray(keys, dtype=object)[present], geometries[present])
+        return keys
+
+    def get(self, keys):
+        with self._lock:
+            cached = {}
+            for key in set(keys):
+                geometry = self._cache.get(key)
+                if geometry is not None:
+                    cached[key] = geometry
+        wanted = [key for key in set(keys) if key is not None and key not in cached]
+
+        if wanted:
+            found_keys, blobs = [], []
+            with self._connect() as db:
+                for start in range(0, len(wanted), SQLITE_MAX_PARAMS):
+                    chunk = wanted[start:start + SQLITE_MAX_PARAMS]
+                    rows = db.execute(
+                        f"SELECT key, wkb FROM geometries WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    for key, wkb in rows:
+                        found_keys.append(key)
+                        blobs.append(wkb)
+            if len(found_keys) < len(wanted):
+                missing = sorted(set(wanted) - set(found_keys))
+                raise LookupError(f"{len(missing)} geometries missing from {self.db_path} (e.g. {missing[0]}).")
+            parsed = shapely.from_wkb(np.asarray(blobs, dtype=object))
+            self._remember(found_keys, parsed)
+            cached.update(zip(found_keys, parsed))
+
+        geometries = np.empty(len(keys), dtype=object)
+        geometries[:] = [cached.get(key) if key is not None else None for key in keys]
+        return geometries
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def geometry_store_for(folder):
+    """
+    The process-wide GeometryStore of a version folder.
+    """
+    db_path = os.path.abspath(os.path.join(folder, GEOMETRY_STORE_FILE))
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            os.makedirs(folder, exist_ok=True)
+            store = _stores[db_path] = GeometryStore(db_path)
+        return store
@@ -2,23 +2,52 @@
 # Import statements
 # -------------------------------------------------------------------
 # Import statements
-import matplotlib.pyplot as plt
 import geopandas as gpd
 import streamlit as st
 import pandas as pd
+import numpy as np
 import folium
+import hashlib
 import random
 import json
 import io
 import os
+import time
 
 # From statements
 from streamlit_folium import st_folium
 from sqlalchemy import create_engine
 from shapely.geometry import shape
+from shapely import area, bounds, centroid, get_x, get_y, to_wkb
 from datetime import datetime
+from functools import partial, wraps
 from folium import plugins
-from fpdf import FPDF
+from folium.utilities import JsCode
+
+# Local modules
+from batch_export import export_versions
+from county_index import CountyIndex
+from export_cache import cached_export, cached_export_path, export_key, file_digest
+from geo_cache import fitted_zoom, lod_level_for_zoom, read_lod_pyramid_cached, source_signature
+from render_service import PDF_EXPORT_SETTINGS, PRIORITY_INTERACTIVE, RenderQueueFull, RenderService, render_version_pdf
+from static_layers import RemoteGeoJson, StaticDocuments
+from tile_server import TILE_LAYER_NAME, TileServer, TileServerCheck
+from topojson_encoder import encode_topology, topology_layer
+from version_cache import VersionCache
+from version_diff import CHANGE_KINDS, diff_summary, diff_version_files
+from version_catalog import CATALOG_FILE, SORT_ORDERS, VersionCatalog
+from version_store import (
+    DELTA_SUFFIX,
+    FGB_SUFFIX,
+    VersionQueueFull,
+    VersionWriter,
+    read_version,
+    read_version_part,
+    supports_partial_reads,
+    version_stem,
+    write_delta_version_atomic,
+    write_flatgeobuf_atomic,
+)
 
 # -------------------------------------------------------------------
 # Configuration & Basic Setup
@@ -29,10 +58,58 @@ PRIMARY_COLOR = "#B58264"
 HIGHLIGHT_COLOR = "#3A052E"
 VERSION_FOLDER = "data/output/"
 GEOJSON_FILE = "data/input/counties_0.geojson"
+ZIP_CODE_FILE = "data/input/zip_codes_0.geojson"
 STATE_CODE_FILE = "data/input/state_code_to_name_0.json"
+CACHE_FOLDER = "data/cache/"
+
+# Local vector tile server (bind address, and the URL the browser uses)
+TILE_SERVER_HOST = os.environ.get("TILE_SERVER_HOST", "127.0.0.1")
+TILE_SERVER_PORT = int(os.environ.get("TILE_SERVER_PORT", "8765"))
+TILE_SERVER_URL = os.environ.get("TILE_SERVER_URL", f"http://localhost:{TILE_SERVER_PORT}")
+# Memory budget for the layers registered with the tile server
+TILE_REGISTRY_MB = int(os.environ.get("TILE_REGISTRY_MB", "256"))
+
+# Render worker pool for snapshots / PDFs (processes, bounded job queue)
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", min(2, os.cpu_count() or 1)))
+RENDER_QUEUE_SIZE = int(os.environ.get("RENDER_QUEUE_SIZE", "32"))
+RENDER_TIMEOUT = 60  # seconds an export waits for a queue slot
+
+# Map frame size: the height is fixed, the width follows the (wide) page;
+# the widest frame is assumed when estimating the zoom fit_bounds picks,
+# so the level of detail errs on the finer side
+MAP_HEIGHT_PX = 600
+MAP_MAX_WIDTH_PX = 1920
+
+# Memory budget for opened versions, shared by all sessions
+VERSION_CACHE_MB = int(os.environ.get("VERSION_CACHE_MB", "512"))
+
+# Map styles are precomputed columns (see with_style_columns) applied in the
+# browser by DATA_DRIVEN_STYLE
+STYLE_PROPERTIES = ["style_fill", "style_stroke", "style_weight", "style_opacity"]
+DATA_DRIVEN_STYLE = """function(feature) {
+    var p = feature.properties;
+    return {fillColor: p.style_fill, color: p.style_stroke, weight: p.style_weight, fillOpacity: p.style_opacity};
+}"""
+TILE_PROPERTIES = ["NAME", "SalesRep", "Product", "color"] + STYLE_PROPERTIES
+TOPOLOGY_PROPERTIES = ["NAME", "SalesRep", "Product", "color", "STATEFP"] + STYLE_PROPERTIES
+RENDER_MODES = ["GeoJSON", "TopoJSON", "Vector tiles"]
+VERSIONS_PER_PAGE = 25
+# Version file formats offered when saving
+SAVE_FORMATS = {
+    "Delta (smallest)": DELTA_SUFFIX,
+    "FlatGeobuf (spatial index, partial loading)": FGB_SUFFIX,
+}
+VERSION_AREAS = ["Whole version", "One state", "Current map view"]
+# Version diff layer: fill color per change kind
+DIFF_COLORS = {"added": "#2E7D32", "removed": "#C62828", "geometry": "#EF6C00", "restyled": "#1565C0"}
 
 os.makedirs(VERSION_FOLDER, exist_ok=True)
 
+# Copy-on-Write keeps frames derived from the shared base layer from writing
+# back into it (always on from pandas 3.0, opt-in before that)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
 # -------------------------------------------------------------------
 # Helper Functions
 # -------------------------------------------------------------------
@@ -41,30 +118,175 @@ def load_state_codes(path):
     with open(path, "r") as file:
         return json.load(file)
 
-def compute_union_all(geometry_series):
+def build_state_metadata(gdf):
     """
-    Use shapely's union_all() to compute the union of geometries.
-    This is more efficient than iterating union step by step.
+    One row per STATEFP (plus an 'All' row) with map framing info:
+    area-weighted centroid, bounding box, county count, total ALAND/AWATER.
+    Counties don't overlap, so the area-weighted mean of county centroids
+    equals the centroid of their union without computing the union.
     """
-    return geometry_series.union_all()
+    columns = ["centroid_x", "centroid_y", "minx", "miny", "maxx", "maxy",
+               "county_count", "ALAND", "AWATER"]
+    if gdf.empty:
+        return pd.DataFrame(columns=columns)
+
+    geoms = gdf.geometry.values
+    areas = area(geoms)
+    centers = centroid(geoms)
+    boxes = bounds(geoms)
+    parts = pd.DataFrame({
+        "STATEFP": gdf["STATEFP"].to_numpy() if "STATEFP" in gdf.columns else None,
+        "weight": areas,
+        "wx": get_x(centers) * areas,
+        "wy": get_y(centers) * areas,
+        "minx": boxes[:, 0],
+        "miny": boxes[:, 1],
+        "maxx": boxes[:, 2],
+        "maxy": boxes[:, 3],
+        "ALAND": pd.to_numeric(gdf["ALAND"], errors="coerce") if "ALAND" in gdf.columns else np.nan,
+        "AWATER": pd.to_numeric(gdf["AWATER"], errors="coerce") if "AWATER" in gdf.columns else np.nan,
+    })
+    aggregations = {
+        "weight": "sum", "wx": "sum", "wy": "sum",
+        "minx": "min", "miny": "min", "maxx": "max", "maxy": "max",
+        "ALAND": "sum", "AWATER": "sum",
+    }
 
-@st.cache_data
-def load_geojson(file_path):
+    per_state = parts.groupby("STATEFP").agg(aggregations)
+    per_state["county_count"] = parts.groupby("STATEFP").size()
+    overall = parts.agg(aggregations).to_frame("All").T
+    overall["county_count"] = len(parts)
+    table = pd.concat([per_state, overall])
+
+    table["centroid_x"] = table["wx"] / table["weight"]
+    table["centroid_y"] = table["wy"] / table["weight"]
+    return table[columns]
+
+def map_framing(metadata, key):
+    """
+    Return (location, bounds) for a metadata row, or (None, None) if missing.
+    Bounds are in folium's [[south, west], [north, east]] order and are
+    dropped for extents crossing the antimeridian (e.g. Alaska), where a
+    lon/lat box would span the whole globe.
+    """
+    if key not in metadata.index:
+        return None, None
+    row = metadata.loc[key].astype(float)
+    if pd.isna(row["centroid_x"]):
+        return None, None
+    location = [row["centroid_y"], row["centroid_x"]]
+    if row["maxx"] - row["minx"] > 180:
+        return location, None
+    return location, [[row["miny"], row["minx"]], [row["maxy"], row["maxx"]]]
+
+def state_bbox(metadata, key):
+    """
+    (minx, miny, maxx, maxy) of a state from the metadata table, or None.
+    """
+    if key not in metadata.index:
+        return None
+    row = metadata.loc[key, ["minx", "miny", "maxx", "maxy"]].astype(float)
+    if row.isna().any():
+        return None
+    return tuple(row.tolist())
+
+def bounds_bbox(bounds):
+    """
+    (minx, miny, maxx, maxy) from the map bounds st_folium returns, rounded
+    so small jitter does not change cache keys; None when unavailable.
+    """
+    try:
+        south_west, north_east = bounds["_southWest"], bounds["_northEast"]
+        bbox = (south_west["lng"], south_west["lat"], north_east["lng"], north_east["lat"])
+        return tuple(round(float(value), 3) for value in bbox)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def feature_keys(gdf):
     """
-    Load GeoJSON into a GeoDataFrame and ensure consistent coloring.
+    Stable id per row: GEOID where present, otherwise a hash of the WKB
+    geometry (e.g. drawn polygons, which have no GEOID).
+    """
+    if "GEOID" in gdf.columns:
+        keys = gdf["GEOID"].astype(object).to_numpy()
+        missing = pd.isna(keys)
+    else:
+        keys = np.empty(len(gdf), dtype=object)
+        missing = np.ones(len(gdf), dtype=bool)
+
+    if missing.any():
+        wkb = to_wkb(gdf.geometry.values[missing])
+        hashes = pd.util.hash_array(np.asarray(wkb, dtype=object))
+        keys = keys.copy()
+        keys[missing] = [f"wkb:{h:016x}" for h in hashes]
+    return keys
+
+def dedupe_features(gdf):
+    """
+    Collapse duplicate features into one row per feature key.
+    - STATEFP becomes the list of distinct, non-empty codes in the group.
+    - NAME, SalesRep, Product and color take the first non-null value.
+    - Rows without geometry are dropped and groups are ordered like
+      geometry sorting (Hilbert distance), matching the previous
+      groupby("geometry") output.
+    """
+    columns = ["NAME", "SalesRep", "Product", "color"]
+    gdf = gdf[gdf.geometry.notna()]
+    if gdf.empty:
+        return gpd.GeoDataFrame(
+            columns=["STATEFP"] + columns + ["geometry"], geometry="geometry", crs=gdf.crs
+        )
+
+    codes, uniques = pd.factorize(feature_keys(gdf))
+    _, first_rows = np.unique(codes, return_index=True)
+
+    firsts = pd.DataFrame({col: gdf[col].to_numpy() for col in columns}).groupby(codes).first()
+
+    # Distinct truthy STATEFP values per group, in one pass over the rows
+    pairs = pd.DataFrame({"code": codes, "state": gdf["STATEFP"].to_numpy(dtype=object)})
+    pairs = pairs.drop_duplicates()
+    pairs = pairs[pairs["state"].astype(bool)].sort_values("code", kind="stable")
+    split_at = np.searchsorted(pairs["code"].to_numpy(), np.arange(1, len(uniques)))
+    state_lists = [part.tolist() for part in np.split(pairs["state"].to_numpy(), split_at)]
+
+    result = gpd.GeoDataFrame(
+        {
+            "STATEFP": state_lists,
+            "NAME": firsts["NAME"].to_numpy(),
+            "SalesRep": firsts["SalesRep"].to_numpy(),
+            "Product": firsts["Product"].to_numpy(),
+            "color": firsts["color"].to_numpy(),
+            "geometry": gdf.geometry.values[first_rows],
+        },
+        geometry="geometry",
+        crs=gdf.crs,
+    )
+    order = result.geometry.values.argsort()
+    return result.take(order).reset_index(drop=True)
+
+def normalize_layer(gdf):
+    """
+    Ensure consistent coloring and codes.
     - If 'color' is missing or null, assign PRIMARY_COLOR.
     - Ensure 'STATEFP' is zero-padded (2 digits).
     """
-    try:
-        gdf = gpd.read_file(file_path)
-        if "color" not in gdf.columns:
-            gdf["color"] = PRIMARY_COLOR
-        else:
-            gdf["color"] = gdf["color"].fillna(PRIMARY_COLOR)
+    if "color" not in gdf.columns:
+        gdf["color"] = PRIMARY_COLOR
+    else:
+        gdf["color"] = gdf["color"].fillna(PRIMARY_COLOR)
 
-        if "STATEFP" in gdf.columns:
-            gdf["STATEFP"] = gdf["STATEFP"].astype(str).str.zfill(2)
-        return gdf
+    if "STATEFP" in gdf.columns:
+        gdf["STATEFP"] = gdf["STATEFP"].astype(str).str.zfill(2)
+    return gdf
+
+def read_layer(file_path):
+    """
+    Load GeoJSON (or a delta version) into a normalized GeoDataFrame.
+    Reads go through the columnar on-disk cache (see geo_cache.py); delta
+    versions are materialized against their base (see version_store.py).
+    """
+    try:
+        return normalize_layer(read_version(file_path, cache_folder=CACHE_FOLDER))
 
     except FileNotFoundError:
         st.error("GeoJSON file not found. Check the path.")
@@ -74,103 +296,470 @@ def load_geojson(file_path):
         st.error(f"Error loading GeoJSON: {e}")
         return gpd.GeoDataFrame({"geometry": []})
 
+@st.cache_resource
+def get_version_cache():
+    """
+    Memory-bounded LRU cache of opened versions, one per process.
+    """
+    return VersionCache(VERSION_CACHE_MB * 1024 * 1024)
+
+def load_geojson(file_path, part=None):
+    """
+    Per-session copy of a saved version. Versions are read once and kept
+    in the shared version cache, keyed by path and file signature;
+    sessions get shallow copies (Copy-on-Write protects the cached frame).
+    part = (bbox, states) reads only those features of a version that
+    supports partial reads (see version_store.read_version_part).
+    """
+    if part is None:
+        read = lambda: read_version(file_path, cache_folder=CACHE_FOLDER)
+    else:
+        read = lambda: read_version_part(file_path, *part)
+    try:
+        gdf = get_version_cache().get(
+            (os.path.abspath(file_path), source_signature(file_path), part),
+            lambda: normalize_layer(read()),
+        )
+    except FileNotFoundError:
+        st.error("GeoJSON file not found. Check the path.")
+        return gpd.GeoDataFrame({"geometry": []})
+    except Exception as e:
+        st.error(f"Error loading GeoJSON: {e}")
+        return gpd.GeoDataFrame({"geometry": []})
+    return gdf.copy(deep=False)
+
+class BaseLayerStore:
+    """
+    Process-wide, read-only holder for the base county layer.
+    Every session gets the same underlying data without pickling; callers
+    receive shallow copies, so with Copy-on-Write any column assignment or
+    in-place edit only touches the caller's copy, never the shared frame.
+
+    At load time the layer is also partitioned by state: a STATEFP-sorted
+    copy (stable, so each state keeps its original row order) is sliced by
+    row position, and sorted county names are cached per state. Switching
+    states is a dictionary lookup instead of a scan over every county.
+
+    An optional level-of-detail pyramid ({zoom: simplified geometries}, in
+    row order) lets views swap in simplified geometry for low zoom levels.
+
+    county_index is an STRtree over the counties, for looking up which
+    counties a drawn territory covers.
+    """
+
+    def __init__(self, gdf, known_states=None, lod=None):
+        self._frame = gdf
+        self._lod = lod or {}
+        self.state_metadata = build_state_metadata(gdf)
+        self.county_index = CountyIndex(gdf)
+        self._state_slices = {}
+        self._state_ranges = {}
+        self._sorted_lod = {}
+        self._county_names = {"All": self._sorted_names(gdf)}
+
+        if "STATEFP" in gdf.columns:
+            codes = gdf["STATEFP"].to_numpy()
+            order = np.argsort(codes, kind="stable")
+            self._sorted = gdf.take(order)
+            self._sorted_lod = {z: level[order] for z, level in self._lod.items()}
+            sorted_codes = codes[order]
+            starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+            stops = np.r_[starts[1:], len(sorted_codes)]
+            for start, stop in zip(starts, stops):
+                code = sorted_codes[start]
+                state_slice = self._sorted.iloc[start:stop]
+                self._state_slices[code] = state_slice
+                self._state_ranges[code] = (start, stop)
+                self._county_names[code] = self._sorted_names(state_slice)
+
+        known = set(known_states) if known_states is not None else set(self._state_slices)
+        self.states_in_data = ["All"] + sorted(set(self._state_slices) & known)
+
+    @staticmethod
+    def _sorted_names(gdf):
+        if "NAME" not in gdf.columns:
+            return []
+        return sorted(gdf["NAME"].unique())
+
+    @property
+    def frame(self):
+        return self._frame.copy(deep=False)
+
+    def state_view(self, state_code, zoom=None):
+        """
+        Counties of one state ('All' returns the full layer).
+        With a zoom, geometry comes from the matching pyramid level.
+        """
+        level = lod_level_for_zoom(zoom) if zoom is not None else None
+
+        if state_code == "All":
+            view = self.frame
+            geometries = self._lod.get(level)
+        else:
+            view = self._state_slices.get(state_code)
+            if view is None:
+                return self._frame.iloc[0:0].copy(deep=False)
+            view = view.copy(deep=False)
+            geometries = None
+            if level in self._sorted_lod:
+                start, stop = self._state_ranges[state_code]
+                geometries = self._sorted_lod[level][start:stop]
+
+        if geometries is not None:
+            view[view.geometry.name] = gpd.GeoSeries(geometries, index=view.index, crs=view.crs)
+        return view
+
+    def county_names(self, state_code):
+        """
+        Sorted county names for a state ('All' covers the full layer).
+        """
+        return self._county_names.get(state_code, [])
+
+@st.cache_resource
+def load_base_layer(file_path, state_code_file):
+    """
+    Load the base layer once per process and share it across sessions.
+    """
+    gdf = read_layer(file_path)
+    lod = read_lod_pyramid_cached(file_path, gdf.geometry.values, cache_folder=CACHE_FOLDER) if not gdf.empty else None
+    return BaseLayerStore(gdf, load_state_codes(state_code_file).keys(), lod)
+
+def sales_fingerprint(sales_df):
+    """
+    Content hash of the sales table; changes whenever any value, or the
+    order of the rows, changes (duplicate keys resolve to the first row).
+    """
+    row_hashes = pd.util.hash_pandas_object(sales_df, index=False).to_numpy()
+    return f"{len(sales_df)}-{'-'.join(sales_df.columns)}-{hashlib.sha1(row_hashes.tobytes()).hexdigest()}"
+
+class SalesJoin:
+    """
+    Sales attributes joined onto the base layer for one version of the
+    sales data. The (STATEFP, NAME) -> row index is built once; the joined
+    and deduplicated display frame is then cached per state, so reruns
+    (e.g. picking another county) reuse it instead of merging again.
+    Matches the previous outer merge: counties without sales keep None,
+    sales rows without a county are dropped, and duplicate sales rows
+    contribute their first non-null SalesRep / Product.
+    """
+
+    ATTRIBUTES = ["SalesRep", "Product"]
+
+    def __init__(self, sales_df, fingerprint=""):
+        self.fingerprint = fingerprint
+        sales = sales_df.rename(columns={"CountyName": "NAME", "StateFIPS": "STATEFP"})
+        keys = pd.MultiIndex.from_arrays(
+            [sales["STATEFP"].astype(str), sales["NAME"]], names=["STATEFP", "NAME"]
+        )
+        attributes = pd.DataFrame(
+            {col: sales[col].to_numpy(dtype=object) if col in sales.columns else None
+             for col in self.ATTRIBUTES},
+            index=keys,
+        )
+        attributes = attributes.groupby(level=["STATEFP", "NAME"], sort=False).first()
+        self._index = attributes.index
+        self._values = {col: attributes[col].to_numpy(dtype=object) for col in self.ATTRIBUTES}
+        self._display_frames = {}
+        self._topologies = {}
+
+    def lookup(self, gdf):
+        """
+        Sales attribute columns aligned to the rows of gdf (None if unmatched).
+        """
+        row_keys = pd.MultiIndex.from_arrays([gdf["STATEFP"].astype(str), gdf["NAME"]])
+        positions = self._index.get_indexer(row_keys) if len(self._index) else np.full(len(gdf), -1)
+        matched = positions >= 0
+        columns = {}
+        for col, values in self._values.items():
+            column = np.full(len(gdf), None, dtype=object)
+            column[matched] = values[positions[matched]]
+            columns[col] = column
+        return columns
+
+    def display_frame(self, base_layer, state_code, zoom=None):
+        """
+        Deduplicated county layer for a state with sales attributes and a
+        comma-separated STATEFP, ready for the map. With a zoom, geometry
+        comes from the base layer's level-of-detail pyramid.
+        """
+        key = (state_code, lod_level_for_zoom(zoom) if zoom is not None else None)
+        frame = self._display_frames.get(key)
+        if frame is None:
+            frame = base_layer.state_view(state_code, zoom)
+            for col, values in self.lookup(frame).items():
+                frame[col] = values
+            frame["color"] = frame["color"].fillna(PRIMARY_COLOR)
+
+            frame = dedupe_features(frame)
+            frame["STATEFP"] = frame["STATEFP"].apply(
+                lambda x: ", ".join(x) if isinstance(x, list) else x
+            )
+            frame = with_style_columns(frame)
+            self._display_frames[key] = frame
+        return frame.copy(deep=False)
+
+    def topology(self, base_layer, state_code):
+        """
+        Quantized TopoJSON of the full-resolution display frame, cached per
+        state. Shared county borders are encoded once.
+        """
+        topology = self._topologies.get(state_code)
+        if topology is None:
+            frame = self.display_frame(base_layer, state_code)
+            topology = encode_topology(frame, "counties", TOPOLOGY_PROPERTIES)
+            self._topologies[state_code] = topology
+        return topology
+
+@st.cache_resource(max_entries=4)
+def load_sales_join(fingerprint, _sales_df):
+    """
+    One SalesJoin per sales-data fingerprint, shared across sessions.
+    """
+    return SalesJoin(_sales_df, fingerprint)
+
+@st.cache_resource
+def get_tile_server():
+    """
+    Start the local vector tile server once per process.
+    """
+    return TileServer(TILE_SERVER_HOST, TILE_SERVER_PORT, max_bytes=TILE_REGISTRY_MB * 1024 * 1024).start()
+
+@st.cache_resource
+def get_static_documents():
+    """
+    Base layer documents served from the app's static folder, or None when
+    server.enableStaticServing is off (the layers are then embedded in the
+    page).
+    """
+    if not st.get_option("server.enableStaticServing"):
+        return None
+    return StaticDocuments(base_url_path=st.get_option("server.baseUrlPath"))
+
+@st.cache_resource
+def load_zip_code_layer(file_path):
+    """
+    Zip code layer, loaded once per process (vector tile mode only).
+    """
+    return with_style_columns(read_layer(file_path))
+
+@st.cache_data(max_entries=32)
+def load_version_lod(file_path, zoom):
+    """
+    Simplified geometries of a saved version for a map zoom (None when the
+    zoom needs full resolution). The pyramid is cached on disk per file.
+    """
+    level = lod_level_for_zoom(zoom)
+    gdf = load_geojson(file_path)
+    if level is None or gdf.empty:
+        return None
+    return read_lod_pyramid_cached(file_path, gdf.geometry.values, cache_folder=CACHE_FOLDER)[level]
+
+@st.cache_resource(max_entries=8)
+def load_version_topology(file_path, signature, part=None):
+    """
+    Quantized TopoJSON of a saved version (or of part of it), cached per
+    file signature.
+    """
+    gdf = load_geojson(file_path, part)
+    for col in ["SalesRep", "Product"]:
+        if col not in gdf.columns:
+            gdf[col] = None
+    return encode_topology(with_style_columns(gdf, version=True), "counties", TOPOLOGY_PROPERTIES)
+
+@st.cache_data(max_entries=16)
+def load_version_diff(old_path, new_path, old_digest, new_digest):
+    """
+    Features changed between two saved versions (see version_diff.py),
+    cached per pair of files and content hashes.
+    """
+    return diff_version_files(old_path, new_path, load_geojson, old_digest, new_digest)
+
+@st.cache_data(max_entries=64)
+def load_version_metadata(file_path):
+    """
+    State metadata table for a saved version, built once per file.
+    """
+    return build_state_metadata(load_geojson(file_path))
+
 def save_geojson(data, file_path):
     """
-    Save a GeoDataFrame as GeoJSON, with robust error handling.
+    Save a GeoDataFrame as GeoJSON (or, for a .fgb path, as FlatGeobuf
+    with a spatial index), with robust error handling.
     """
     try:
-        data.to_file(file_path, driver="GeoJSON")
+        if file_path.endswith(FGB_SUFFIX):
+            data.to_file(file_path, driver="FlatGeobuf", SPATIAL_INDEX="YES")
+        else:
+            data.to_file(file_path, driver="GeoJSON")
         st.success(f"Saved version to `{file_path}`")
     except Exception as e:
         st.error(f"Error saving GeoJSON: {e}")
 
-def list_saved_versions(folder_path):
+def merge_proposed_territories(filtered_gdf, full_gdf, pending_polygons, states_with_proposed,
+                               statefps, proposed_names):
     """
-    List .geojson version files sorted by timestamp descending (most recent first).
-    Uses a simple pattern: 'someName_YYYYMMDD_HHMMSS.geojson'.
+    Build the frame to save: the current view, plus every county of the
+    states with proposals (recolored to PRIMARY_COLOR, deduplicated on
+    STATEFP/NAME/geometry), plus one row per drawn polygon (STATEFP and
+    NAME from statefps / proposed_names, one per polygon).
+    All drawn polygons go in as a single frame, so the cost does not grow
+    with the square of the number of polygons.
     """
-    if not os.path.exists(folder_path):
-        return []
+    final_gdf = filtered_gdf
+    if states_with_proposed:
+        updated_states_gdf = full_gdf[full_gdf["STATEFP"].isin(states_with_proposed)]
+        final_gdf = pd.concat([filtered_gdf, updated_states_gdf]).drop_duplicates(
+            subset=["STATEFP", "NAME", "geometry"]
+        ).reset_index(drop=True)
+
+        # Color original counties in these states
+        mask_updated = final_gdf["STATEFP"].isin(states_with_proposed)
+        mask_proposed = final_gdf["NAME"].str.endswith("(Proposed)", na=False)
+        final_gdf.loc[mask_updated & ~mask_proposed, "color"] = PRIMARY_COLOR
+
+    proposed_gdf = gpd.GeoDataFrame(
+        {
+            "STATEFP": list(statefps),
+            "NAME": list(proposed_names),
+            "color": [color for _, color in pending_polygons],
+            "geometry": [poly for poly, _ in pending_polygons],
+        },
+        crs=final_gdf.crs,
+    )
+    return pd.concat([final_gdf, proposed_gdf], ignore_index=True)
 
-    geojson_files = [f for f in os.listdir(folder_path) if f.endswith(".geojson")]
+@st.cache_data
+def version_file_digest(file_path, signature):
+    """
+    Content hash of a version file, recomputed only when its signature
+    (mtime + size) changes.
+    """
+    return file_digest(file_path)
 
-    def extract_timestamp(filename):
-        try:
-            base = os.path.splitext(filename)[0]
-            parts = base.split("_")
-            if len(parts) >= 2:
-                date_part = parts[-2]  # e.g. '20230412'
-                time_part = parts[-1]  # e.g. '153000'
-                timestamp_str = f"{date_part}_{time_part}"
-                return datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-            else:
-                return datetime.min
-        except:
-            return datetime.min
+def version_pdf_key(version_path, version_name, highlights):
+    """
+    Export cache key: version contents, name, highlights and PDF settings.
+    """
+    digest = version_file_digest(version_path, source_signature(version_path))
+    return export_key("pdf", digest, version_name, highlights, PDF_EXPORT_SETTINGS)
 
-    return sorted(geojson_files, key=extract_timestamp, reverse=True)
+@st.cache_resource
+def get_version_catalog():
+    """
+    Version catalog, one per process. The first call records versions
+    saved before the catalog existed.
+    """
+    catalog = VersionCatalog(os.path.join(VERSION_FOLDER, CATALOG_FILE))
+    catalog.sync(VERSION_FOLDER, read_version)
+    return catalog
 
-def generate_map_snapshot(gdf, title="Proposed Districts Snapshot"):
+@st.cache_resource
+def get_version_writer():
     """
-    Generate a PNG snapshot of a GeoDataFrame with matplotlib.
-    Return an in-memory buffer for further usage (e.g., embedding in PDF).
+    Background version writer, one per process; records saved versions
+    in the catalog.
     """
-    if gdf.empty:
-        fig, ax = plt.subplots(figsize=(8, 6))
-        ax.text(0.5, 0.5, "No geometry to display", ha="center", va="center")
-        ax.axis("off")
-    else:
-        fig, ax = plt.subplots(figsize=(8, 6))
-        gdf.plot(ax=ax, edgecolor="black", color=gdf["color"], alpha=0.6)
-        ax.set_title(title)
-        ax.axis("off")
-        ax.set_aspect("equal")
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", bbox_inches="tight")
-    plt.close(fig)
-    buf.seek(0)
-    return buf
-
-def generate_pdf(map_png, version_name, highlights):
-    """
-    Create an in-memory PDF with the provided map snapshot, version text, etc.
-    """
-    pdf = FPDF(orientation="L", unit="mm", format="A4")
-    pdf.add_page()
-
-    pdf.set_font("Arial", "B", 16)
-    pdf.cell(0, 10, "Territory Plan", ln=True, align="C")
-
-    pdf.set_font("Arial", "B", 12)
-    pdf.cell(0, 10, f"Version: {version_name}", ln=True)
-
-    if map_png:
-        temp_file = "temp_map_snapshot.png"
-        try:
-            with open(temp_file, "wb") as temp_img:
-                temp_img.write(map_png.getbuffer())
-
-            page_width = 297
-            margin = 10
-            map_width = int(page_width * 0.7) - (2 * margin)
-            comments_width = int(page_width * 0.3) - margin
-            map_x = margin
-            map_y = pdf.get_y()
-            pdf.image(temp_file, x=map_x, y=map_y, w=map_width)
-
-            pdf.set_xy(map_x + map_width + margin, map_y)
-            pdf.set_font("Arial", "I", 10)
-            pdf.multi_cell(comments_width, 10, f"Comments: {highlights}")
-        finally:
-            try:
-                os.remove(temp_file)
-            except FileNotFoundError:
-                pass
+    return VersionWriter(catalog=get_version_catalog())
 
-        pdf_buffer = io.BytesIO(pdf.output(dest="S").encode("latin-1"))
-        return pdf_buffer
-    return None
+@st.fragment(run_every="1s")
+def save_progress():
+    """
+    Poll background saves while this session has some running. When one
+    finishes, rerun the whole app so the new version gets listed.
+    """
+    writer = get_version_writer()
+    for job in writer.in_progress():
+        st.info(f"Saving `{os.path.basename(job['file'])}` ({job['features']} features): {job['state']}...")
+
+    statuses = {job_id: writer.status(job_id) for job_id in st.session_state["save_jobs"]}
+    finished = {
+        job_id: job for job_id, job in statuses.items()
+        if job is None or job["state"] in ("done", "failed")
+    }
+    if finished:
+        st.session_state["save_jobs"] = [job_id for job_id in statuses if job_id not in finished]
+        saved = [job for job in finished.values() if job is not None and job["state"] == "done"]
+        if saved:
+            st.session_state["save_notice"] = "Saved " + ", ".join(
+                f"`{job['file']}` ({job['seconds']:.1f}s)" for job in saved
+            ) + "."
+        st.session_state["save_failures"] = [
+            f"Error saving `{job['file']}`: {job['error']}"
+            for job in finished.values()
+            if job is not None and job["state"] == "failed"
+        ]
+        st.rerun(scope="app")
+
+@st.cache_resource
+def get_render_service():
+    """
+    Start the render worker pool once per process.
+    """
+    return RenderService(RENDER_WORKERS, RENDER_QUEUE_SIZE)
+
+def build_version_pdf(version_gdf, version_name, highlights):
+    """
+    Render the snapshot and PDF for a version (bytes) on the render pool.
+    Only the columns the snapshot draws are sent to the worker.
+    """
+    job = get_render_service().submit(
+        render_version_pdf,
+        version_gdf[["color", version_gdf.geometry.name]],
+        version_name,
+        highlights,
+        PDF_EXPORT_SETTINGS["snapshot_title"],
+        PDF_EXPORT_SETTINGS["figsize"],
+        priority=PRIORITY_INTERACTIVE,
+        timeout=RENDER_TIMEOUT,
+    )
+    return job.result()
+
+def render_pool_status(metrics):
+    """
+    One-line summary of the render pool's queue and latency metrics.
+    """
+    status = (
+        f"Render pool: {metrics['workers']} workers, {metrics['in_flight']} rendering, "
+        f"{metrics['queue_depth']}/{metrics['max_queue']} queued, {metrics['completed']} done"
+    )
+    if metrics["render_p50_ms"] is not None:
+        status += (
+            f"; render p50 {metrics['render_p50_ms']:.0f} ms / p95 {metrics['render_p95_ms']:.0f} ms"
+            f", queue wait p95 {metrics['wait_p95_ms']:.0f} ms"
+        )
+    return status
+
+def version_cache_status(stats):
+    """
+    One-line summary of the version cache's memory use and hit rate.
+    """
+    return (
+        f"Version cache: {stats['entries']} versions, {stats['bytes'] / 1024 ** 2:.1f}/"
+        f"{stats['max_bytes'] / 1024 ** 2:.0f} MB, {stats['hits']} hits / {stats['misses']} misses / "
+        f"{stats['evictions']} evictions"
+    )
+
+def timed_fragment(name):
+    """
+    Decorator: run the function as an st.fragment (interactions inside it
+    rerun only that function) and end it with a timing readout. The run
+    counter shows which fragments an interaction actually reran.
+    """
+    def decorate(func):
+        @wraps(func)
+        def run():
+            start = time.perf_counter()
+            try:
+                func()
+            finally:
+                runs = st.session_state.setdefault("fragment_runs", {})
+                runs[name] = runs.get(name, 0) + 1
+                st.caption(
+                    f"{name}: rendered in {(time.perf_counter() - start) * 1000:.0f} ms "
+                    f"(run {runs[name]} this session)"
+                )
+        return st.fragment(run)
+    return decorate
 
 def get_random_color():
     """
@@ -178,26 +767,144 @@ def get_random_color():
     """
     return "#{:06x}".format(random.randint(0, 0xFFFFFF))
 
-def style_function(feature):
-    cty_name = feature["properties"].get("NAME", "")
-    if cty_name == selected_county:
-        return {
-            "fillColor": HIGHLIGHT_COLOR,
-            "color": HIGHLIGHT_COLOR,
-            "weight": 2,
-            "fillOpacity": 0.6,
+def with_style_columns(gdf, highlight=False, version=False):
+    """
+    Vectorized map styling: add the STYLE_PROPERTIES columns that
+    DATA_DRIVEN_STYLE reads in the browser.
+    - Default: feature color, weight 1, fill opacity 0.4.
+    - version=True: fill opacity 0.6 for recolored (non-primary) features.
+    - highlight=True: HIGHLIGHT_COLOR, weight 2, fill opacity 0.6.
+    """
+    styled = gdf.copy(deep=False)
+    if highlight:
+        styled["style_fill"] = HIGHLIGHT_COLOR
+        styled["style_stroke"] = HIGHLIGHT_COLOR
+        styled["style_weight"] = 2
+        styled["style_opacity"] = 0.6
+        return styled
+
+    if "color" in styled.columns:
+        color = styled["color"].fillna(PRIMARY_COLOR).to_numpy(dtype=object)
+    else:
+        color = np.full(len(styled), PRIMARY_COLOR, dtype=object)
+    styled["style_fill"] = color
+    styled["style_stroke"] = color
+    styled["style_weight"] = 1
+    styled["style_opacity"] = np.where(color != PRIMARY_COLOR, 0.6, 0.4) if version else 0.4
+    return styled
+
+def styled_geojson(gdf, tooltip=True):
+    """
+    folium.GeoJson styled client-side from the style columns (no Python
+    style_function evaluated per feature).
+    """
+    return folium.GeoJson(
+        gdf.__geo_interface__,
+        style=JsCode(DATA_DRIVEN_STYLE),
+        tooltip=folium.GeoJsonTooltip(
+            fields=["NAME", "SalesRep", "Product"],
+            aliases=["County:", "Sales Rep:", "Product:"],
+        ) if tooltip else None,
+    )
+
+def highlight_layer(gdf, county_name):
+    """
+    Small overlay holding only the features named county_name, so changing
+    the selected county never restyles or re-serializes the base layer.
+    """
+    highlighted = gdf[gdf["NAME"] == county_name]
+    if highlighted.empty:
+        return None
+    return styled_geojson(with_style_columns(highlighted, highlight=True))
+
+def diff_layer(diff):
+    """
+    Layer holding only the changed features of a version diff, colored
+    by change kind (removed features are drawn faintly).
+    """
+    styled = diff.copy(deep=False)
+    color = styled["change"].map(DIFF_COLORS).to_numpy(dtype=object)
+    styled["style_fill"] = color
+    styled["style_stroke"] = color
+    styled["style_weight"] = 2
+    styled["style_opacity"] = np.where(styled["change"] == "removed", 0.15, 0.5)
+    return folium.GeoJson(
+        styled[["NAME", "change", "changed"] + STYLE_PROPERTIES + [styled.geometry.name]].__geo_interface__,
+        style=JsCode(DATA_DRIVEN_STYLE),
+        tooltip=folium.GeoJsonTooltip(
+            fields=["NAME", "change", "changed"],
+            aliases=["Feature:", "Change:", "Changed columns:"],
+        ),
+    )
+
+def vector_tile_options():
+    """
+    Leaflet.VectorGrid options: DATA_DRIVEN_STYLE per tile feature.
+    """
+    return """{
+        "interactive": true,
+        "vectorTileLayerStyles": {
+            "%s": function(properties, zoom) {
+                var style = (%s)({properties: properties});
+                style.fill = true;
+                return style;
+            }
         }
-    color = feature["properties"].get("color", PRIMARY_COLOR)
-    return {"fillColor": color, "color": color, "weight": 1, "fillOpacity": 0.4}
-
-def style_function_version(feature):
-    district_color = feature["properties"].get("color", PRIMARY_COLOR)
-    return {
-        "fillColor": district_color,
-        "color": district_color,
-        "weight": 1,
-        "fillOpacity": 0.6 if district_color != PRIMARY_COLOR else 0.4,
-    }
+    }""" % (TILE_LAYER_NAME, DATA_DRIVEN_STYLE)
+
+def pending_layer(pending_polygons):
+    """
+    Not-yet-saved drawn polygons, each in its assigned color.
+    """
+    pending = gpd.GeoDataFrame(
+        {"color": [color for _, color in pending_polygons]},
+        geometry=[poly for poly, _ in pending_polygons],
+        crs="EPSG:4326",
+    )
+    return styled_geojson(with_style_columns(pending, version=True), tooltip=False)
+
+def coverage_summary(coverage, limit=3):
+    """
+    'Travis (Texas) 62%, Hays (Texas) 38%' for one polygon's coverage rows:
+    the counties holding the largest shares of the territory.
+    """
+    parts = [
+        f"{row.NAME} ({STATE_CODE_TO_NAME.get(row.STATEFP, row.STATEFP)}) {row.territory_pct:.0f}%"
+        for row in coverage.head(limit).itertuples()
+    ]
+    if len(coverage) > limit:
+        parts.append(f"{len(coverage) - limit} more")
+    return ", ".join(parts)
+
+def pending_coverage(county_index, pending_polygons, coverages):
+    """
+    Coverage of all pending polygons (polygon = position in
+    pending_polygons), from the per-polygon coverages kept in session
+    state. Polygons without one yet (just drawn) are looked up in one bulk
+    query and their coverage appended to coverages.
+    """
+    missing = pending_polygons[len(coverages):]
+    if missing:
+        found = county_index.coverage([poly for poly, _ in missing])
+        coverages.extend(found[found["polygon"] == i].assign(polygon=0) for i in range(len(missing)))
+    if not coverages:
+        return county_index.coverage([])
+    return pd.concat(
+        [coverage.assign(polygon=i) for i, coverage in enumerate(coverages)], ignore_index=True
+    )
+
+def coverage_table(coverage):
+    """
+    Coverage rows as displayed under the map.
+    """
+    return pd.DataFrame({
+        "Territory": coverage["polygon"].to_numpy() + 1,
+        "County": coverage["NAME"].to_numpy(),
+        "State": [STATE_CODE_TO_NAME.get(code, code) for code in coverage["STATEFP"]],
+        "Share of territory (%)": coverage["territory_pct"].round(1).to_numpy(),
+        "Share of county (%)": coverage["county_pct"].round(1).to_numpy(),
+        "Overlap (km²)": coverage["area_km2"].round(1).to_numpy(),
+    })
 
 # -------------------------------------------------------------------
 # Placeholder / Stub for additional Data/DB logic
@@ -246,16 +953,23 @@ def get_sales_info():
 # -------------------------------------------------------------------
 # Main Script
 # -------------------------------------------------------------------
-full_gdf = load_geojson(GEOJSON_FILE)
+base_layer = load_base_layer(GEOJSON_FILE, STATE_CODE_FILE)
+full_gdf = base_layer.frame
 STATE_CODE_TO_NAME = load_state_codes(STATE_CODE_FILE)
 
 # Initialize session states for polygons & versions
 if "pending_polygons" not in st.session_state:
     st.session_state["pending_polygons"] = []
+# Counties under each pending polygon, looked up once when it is drawn
+if "pending_coverage" not in st.session_state:
+    st.session_state["pending_coverage"] = []
 if "selected_version" not in st.session_state:
     st.session_state["selected_version"] = None
 if "last_polygon" not in st.session_state:
     st.session_state["last_polygon"] = None
+# Background saves started by this session (VersionWriter job ids)
+if "save_jobs" not in st.session_state:
+    st.session_state["save_jobs"] = []
 
 # Keep a list of visited states
 if "updated_states_list" not in st.session_state:
@@ -277,9 +991,7 @@ if "STATEFP" not in full_gdf.columns:
     st.error("No 'STATEFP' column found in the GeoJSON.")
     st.stop()
 
-states_in_data = sorted(set(full_gdf["STATEFP"].unique()) & set(STATE_CODE_TO_NAME.keys()))
-if "All" not in states_in_data:
-    states_in_data.insert(0, "All")
+states_in_data = base_layer.states_in_data
 
 selected_code = st.sidebar.selectbox(
     "Choose State:",
@@ -292,119 +1004,141 @@ if selected_code not in st.session_state["updated_states_list"] and selected_cod
     st.session_state["updated_states_list"].append(selected_code)
 
 # Filter GDF for chosen state
-if selected_code == "All":
-    filtered_gdf = full_gdf
-else:
-    filtered_gdf = full_gdf[full_gdf["STATEFP"] == selected_code]
-
-# Compute centroid
-if not filtered_gdf.empty:
-    combined_geom = compute_union_all(filtered_gdf.geometry)
-    state_centroid = combined_geom.centroid
-else:
-    state_centroid = None
+filtered_gdf = base_layer.state_view(selected_code)
+
+# Map framing from the precomputed state metadata (no union per rerun)
+state_location, state_bounds = map_framing(base_layer.state_metadata, selected_code)
 
 st.sidebar.header("Select a County")
 if "NAME" not in filtered_gdf.columns:
     st.error("No 'NAME' column in the GeoJSON.")
     st.stop()
 
-county_names = sorted(filtered_gdf["NAME"].unique())
+county_names = base_layer.county_names(selected_code)
 selected_county = st.sidebar.selectbox("Choose a county:", county_names)
 
+st.sidebar.header("Map Rendering")
+render_mode = st.sidebar.radio(
+    "Send map layers as:",
+    RENDER_MODES,
+    help="Vector tiles stream only the visible tiles from a local tile server.",
+)
+# The tile server runs for vector tiles only; GeoJSON/TopoJSON base layers
+# are served from the app's static folder
+tile_server = None
+if render_mode == "Vector tiles":
+    try:
+        tile_server = get_tile_server()
+    except OSError as e:
+        st.sidebar.error(f"Tile server unavailable ({e}); using GeoJSON.")
+        render_mode = "GeoJSON"
+static_documents = get_static_documents()
+
 # -------------------------------------------------------------------
 # Tabs
 # -------------------------------------------------------------------
 tab_main, tab_versions, tab_upload = st.tabs(["Main", "Versions", "Upload"])
 
+# Each tab is a fragment: widgets inside a tab rerun only that tab. The
+# sidebar selections above rerun the whole app.
+
 # ===================== TAB: MAIN MAP =====================
-with tab_main:
+@timed_fragment("Main map")
+def main_map_tab():
     st.subheader("Current County Map")
 
-    if selected_code == "All" or state_centroid is None:
+    save_notice = st.session_state.pop("save_notice", None)
+    if save_notice:
+        st.success(save_notice)
+
+    if selected_code == "All" or state_location is None:
         map_location = [39.833, -98.5795]
         map_zoom = 4
+        map_bounds = None
     else:
-        map_location = [state_centroid.y, state_centroid.x]
+        map_location = state_location
         map_zoom = 6
+        map_bounds = state_bounds
 
-    # Load optional sales data
+    # Display frame: sales attributes joined and deduplicated once per
+    # (sales-data version, state), then reused across reruns
     sales_df = get_sales_info()
-
-    # Merge if we have sales data
-    if not sales_df.empty:
-        filtered_gdf["STATEFP"] = filtered_gdf["STATEFP"].astype(str)
-        sales_df["STATEFP"] = sales_df["STATEFP"].astype(str)
-
-        merged_df = pd.merge(
-            filtered_gdf,
-            sales_df.rename(columns={"CountyName": "NAME", "StateFIPS": "STATEFP"}),
-            on=["NAME", "STATEFP"],
-            how="outer",
-            indicator=True
-        )
-        # Group once to minimize duplicates
-        merged_df = (
-            merged_df.groupby("geometry", as_index=False)
-            .agg({
-                "STATEFP": lambda x: list(filter(None, set(x))),
-                "NAME": "first",
-                "SalesRep": "first",
-                "Product": "first",
-                "color": "first",
-                "geometry": "first",
-            })
-        )
-        final_gdf = gpd.GeoDataFrame(merged_df, geometry="geometry", crs=filtered_gdf.crs)
-    else:
-        # No sales data, proceed with filtered_gdf
-        final_gdf = filtered_gdf.copy()
-        final_gdf["SalesRep"] = None
-        final_gdf["Product"] = None
-        final_gdf["color"] = final_gdf["color"].fillna(PRIMARY_COLOR)
-
-        # Group once to ensure uniqueness
-        final_gdf = (
-            final_gdf.groupby("geometry", as_index=False)
-            .agg({
-                "STATEFP": lambda x: list(filter(None, set(x))),
-                "NAME": "first",
-                "SalesRep": "first",
-                "Product": "first",
-                "color": "first",
-                "geometry": "first",
-            })
-        )
-        final_gdf = gpd.GeoDataFrame(final_gdf, geometry="geometry", crs=filtered_gdf.crs)
-
-    # Ensure tooltip fields exist
-    if "SalesRep" not in final_gdf.columns:
-        final_gdf["SalesRep"] = None
-    if "Product" not in final_gdf.columns:
-        final_gdf["Product"] = None
-
-    # Convert STATEFP list to a comma-separated string
-    final_gdf["STATEFP"] = final_gdf["STATEFP"].apply(
-        lambda x: ", ".join(x) if isinstance(x, list) else x
-    )
+    sales_join = load_sales_join(sales_fingerprint(sales_df), sales_df)
+    # (GeoJSON mode draws the pyramid level for the zoom the map opens at,
+    # i.e. the one fit_bounds picks for the state; tiles simplify per tile)
+    # (TopoJSON keeps full resolution: per-polygon simplification would
+    # break the shared borders it encodes once)
+    lod_zoom = None
+    if render_mode == "GeoJSON":
+        lod_zoom = fitted_zoom(map_bounds, MAP_MAX_WIDTH_PX, MAP_HEIGHT_PX) if map_bounds else map_zoom
+    final_gdf = sales_join.display_frame(base_layer, selected_code, lod_zoom)
 
     # Create Folium map
     m = folium.Map(
         location=map_location,
         zoom_start=map_zoom,
         width="100%",
-        height="600",
+        height=MAP_HEIGHT_PX,
         tiles="OpenStreetMap",
     )
+    if map_bounds:
+        m.fit_bounds(map_bounds)
+
+    # Base layer: depends only on (sales-data version, state, render mode).
+    # Served at a versioned URL (tile server, or the app's static folder),
+    # the map below stays byte-identical across reruns and the browser
+    # fetches each layer once.
+    county_tooltip = dict(fields=["NAME", "SalesRep", "Product"], aliases=["County:", "Sales Rep:", "Product:"])
+    if render_mode == "Vector tiles":
+        county_url = tile_server.register(
+            f"counties-{selected_code}", final_gdf, TILE_PROPERTIES, token=sales_join.fingerprint
+        )
+        plugins.VectorGridProtobuf(
+            TILE_SERVER_URL + county_url, "Counties", vector_tile_options()
+        ).add_to(m)
+        TileServerCheck(TILE_SERVER_URL).add_to(m)
+
+        if st.checkbox("Show zip code layer"):
+            zip_url = tile_server.register(
+                "zip_codes",
+                load_zip_code_layer(ZIP_CODE_FILE),
+                TILE_PROPERTIES,
+                token=source_signature(ZIP_CODE_FILE),
+            )
+            plugins.VectorGridProtobuf(
+                TILE_SERVER_URL + zip_url, "Zip Codes", vector_tile_options()
+            ).add_to(m)
+    elif render_mode == "TopoJSON":
+        topology = sales_join.topology(base_layer, selected_code)
+        if static_documents is not None:
+            topology_url = static_documents.publish(
+                f"counties-{selected_code}.topo.json",
+                sales_join.fingerprint,
+                lambda: json.dumps(topology, separators=(",", ":")).encode("utf-8"),
+            )
+            RemoteGeoJson(topology_url, DATA_DRIVEN_STYLE, object_name="counties", **county_tooltip).add_to(m)
+        else:
+            topology_layer(
+                topology, "counties", style=DATA_DRIVEN_STYLE, tooltip=folium.GeoJsonTooltip(**county_tooltip)
+            ).add_to(m)
+    elif static_documents is not None:
+        geojson_url = static_documents.publish(
+            f"counties-{selected_code}-z{lod_level_for_zoom(lod_zoom)}.geo.json",
+            sales_join.fingerprint,
+            lambda: final_gdf[TILE_PROPERTIES + ["geometry"]].to_json(drop_id=True).encode("utf-8"),
+        )
+        RemoteGeoJson(geojson_url, DATA_DRIVEN_STYLE, **county_tooltip).add_to(m)
+    else:
+        styled_geojson(final_gdf).add_to(m)
 
-    folium.GeoJson(
-        final_gdf.__geo_interface__,
-        style_function=style_function,
-        tooltip=folium.GeoJsonTooltip(
-            fields=["NAME", "SalesRep", "Product"],
-            aliases=["County:", "Sales Rep:", "Product:"],
-        ),
-    ).add_to(m)
+    # Dynamic layers: pushed into the mounted map on rerun without
+    # reloading it (selected county, not-yet-saved polygons)
+    dynamic_layers = folium.FeatureGroup(name="Selection")
+    selected_layer = highlight_layer(final_gdf, selected_county)
+    if selected_layer is not None:
+        selected_layer.add_to(dynamic_layers)
+    if st.session_state["pending_polygons"]:
+        pending_layer(st.session_state["pending_polygons"]).add_to(dynamic_layers)
 
     draw_control = plugins.Draw(
         export=False,
@@ -421,7 +1155,7 @@ with tab_main:
     m.add_child(draw_control)
 
     # Render map
-    map_result = st_folium(m, width="100%", height=600)
+    map_result = st_folium(m, width="100%", height=MAP_HEIGHT_PX, feature_group_to_add=dynamic_layers)
 
     # Capture newly drawn polygons
     if map_result and "last_active_drawing" in map_result:
@@ -436,12 +1170,19 @@ with tab_main:
                 if drawn_shape.geom_type in ["Polygon", "MultiPolygon"]:
                     rand_color = get_random_color()
                     st.session_state["pending_polygons"].append((drawn_shape, rand_color))
-
-                    # If user draws a polygon in a real state, track it
-                    if selected_code != "All":
-                        st.session_state["states_with_proposed"].add(selected_code)
-
-                    st.success(f"Added new territory with color {rand_color}.")
+                    pending_coverage(
+                        base_layer.county_index,
+                        st.session_state["pending_polygons"],
+                        st.session_state["pending_coverage"],
+                    )
+                    drawn_coverage = st.session_state["pending_coverage"][-1]
+                    if drawn_coverage.empty:
+                        st.success(f"Added new territory with color {rand_color} (outside every county).")
+                    else:
+                        st.success(
+                            f"Added new territory with color {rand_color}, covering "
+                            f"{len(drawn_coverage)} counties: {coverage_summary(drawn_coverage)}."
+                        )
                 else:
                     st.error(f"Only polygons are accepted (you drew {drawn_shape.geom_type}).")
             else:
@@ -450,7 +1191,16 @@ with tab_main:
     num_pending = len(st.session_state["pending_polygons"])
     st.write(f"**Updated Districts:** {num_pending}")
 
+    # Counties under the drawn territories (looked up when each was drawn)
+    coverage = pending_coverage(
+        base_layer.county_index, st.session_state["pending_polygons"], st.session_state["pending_coverage"]
+    )
+    if num_pending:
+        with st.expander(f"Counties covered ({coverage['GEOID'].nunique()})"):
+            st.dataframe(coverage_table(coverage), hide_index=True)
+
     version_name = st.text_input("Enter version name (e.g., 'Draft 1'):")
+    save_format = st.radio("Save as:", list(SAVE_FORMATS), horizontal=True)
 
     # ------------------ SAVE PROPOSED TERRITORIES ------------------
     if st.button("Save Proposed Territories"):
@@ -459,59 +1209,58 @@ with tab_main:
         elif not version_name.strip():
             st.error("Please enter a version name before saving.")
         else:
-            # 1) Start with a copy of filtered_gdf
-            final_gdf = filtered_gdf.copy()
-
-            # 2) Append newly drawn polygons
-            for poly, color in st.session_state["pending_polygons"]:
-                
-                # 3) If any states have proposed polygons, color their counties
-                if st.session_state["states_with_proposed"]:
-                    updated_states_gdf = full_gdf[
-                        full_gdf["STATEFP"].isin(st.session_state["states_with_proposed"])
-                    ]
-                    final_gdf = pd.concat([final_gdf, updated_states_gdf]).drop_duplicates(
-                        subset=["STATEFP", "NAME", "geometry"]
-                    ).reset_index(drop=True)
-
-                    # Color original counties in these states
-                    mask_updated = final_gdf["STATEFP"].isin(st.session_state["states_with_proposed"])
-                    mask_proposed = final_gdf["NAME"].str.endswith("(Proposed)")
-                    final_gdf.loc[mask_updated & ~mask_proposed, "color"] = PRIMARY_COLOR
-                
-                statefp_val = selected_code if selected_code != "All" else None
-                new_row = gpd.GeoDataFrame(
-                    {
-                        "STATEFP": [statefp_val],
-                        "NAME": [f"{selected_county} (Proposed)"],
-                        "color": [color],
-                        "geometry": [poly],
-                    },
-                    crs=final_gdf.crs,
-                )
-                final_gdf = pd.concat([final_gdf, new_row], ignore_index=True)
+            # 1-3) Current view + all drawn polygons, merged in one pass;
+            # each polygon is named after the county holding most of it and
+            # saved under that county's state, which is then tracked as a
+            # state with proposals (outside every county: the selected one)
+            statefp_val = selected_code if selected_code != "All" else None
+            main_counties = CountyIndex.main_counties(coverage, num_pending)
+            statefps = [state if state is not None else statefp_val for state in main_counties["STATEFP"]]
+            st.session_state["states_with_proposed"].update(state for state in statefps if state is not None)
+            final_gdf = merge_proposed_territories(
+                filtered_gdf,
+                full_gdf,
+                st.session_state["pending_polygons"],
+                st.session_state["states_with_proposed"],
+                statefps,
+                [f"{name if name is not None else selected_county} (Proposed)" for name in main_counties["NAME"]],
+            )
 
             # Clear pending polygons to free memory
             st.session_state["pending_polygons"].clear()
-            st.success("Pending polygons merged into dataset.")
+            st.session_state["pending_coverage"].clear()
 
             # 4) Generate version file
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            saved_at = datetime.now()
+            timestamp = saved_at.strftime("%Y%m%d_%H%M%S")
             sanitized_name = "".join(
                 c for c in version_name if c.isalnum() or c in (" ", "_", "-")
             ).rstrip()
-            version_file = os.path.join(VERSION_FOLDER, f"{sanitized_name}_{timestamp}.geojson")
-
-            # 5) Save
+            suffix = SAVE_FORMATS[save_format]
+            version_file = os.path.join(VERSION_FOLDER, f"{sanitized_name}_{timestamp}{suffix}")
+
+            # 5) Save in the background, as a delta against the base layer
+            # or as FlatGeobuf (atomic rename when complete), then record it
+            # in the catalog; the Versions tab shows the save until the file
+            # is in place
+            touched_states = set(st.session_state["states_with_proposed"])
             try:
-                final_gdf.to_file(version_file, driver="GeoJSON")
-                st.success(f"Proposed district saved as `{version_file}`")
-            except Exception as e:
-                st.error(f"Error saving GeoJSON: {e}")
+                job_id = get_version_writer().submit(
+                    final_gdf,
+                    version_file,
+                    write=(
+                        partial(write_delta_version_atomic, base_file=GEOJSON_FILE, cache_folder=CACHE_FOLDER)
+                        if suffix == DELTA_SUFFIX
+                        else write_flatgeobuf_atomic
+                    ),
+                    entry={"name": sanitized_name, "created": saved_at, "states": touched_states},
+                )
+            except VersionQueueFull as e:
+                st.error(str(e))
                 st.stop()
+            st.session_state["save_jobs"].append(job_id)
 
             st.session_state["selected_version"] = os.path.basename(version_file)
-            st.info("Version saved. Navigate to 'Versions' tab to view.")
 
             # 6) Optional: IBM ODM or Align Star calls
             # call_ibm_odm_api(final_gdf)
@@ -520,18 +1269,155 @@ with tab_main:
             # 7) Optional: Write to Postgres
             # write_to_postgres(final_gdf, table_name="final_districts")
 
+            # A new version changes the Versions tab too: rerun the whole app
+            st.session_state["save_notice"] = (
+                f"Pending polygons merged; saving as `{version_file}` in the background. "
+                "Navigate to 'Versions' tab to view."
+            )
+            st.rerun(scope="app")
+
+with tab_main:
+    main_map_tab()
+
 # ===================== TAB: VERSIONS =====================
-with tab_versions:
+@timed_fragment("Versions")
+def versions_tab():
     st.header("Saved Versions")
-    saved_versions = list_saved_versions(VERSION_FOLDER)
-    if not saved_versions:
-        st.info("No saved versions available.")
+    for failure in st.session_state.pop("save_failures", []):
+        st.error(failure)
+    if st.session_state["save_jobs"]:
+        save_progress()
+
+    # Versions are listed from the catalog, a page at a time; the version
+    # files are only opened for the version on display
+    catalog = get_version_catalog()
+    search_col, states_col, sort_col = st.columns([2, 2, 1])
+    search = search_col.text_input("Search by name:")
+    state_filter = states_col.multiselect(
+        "States touched:",
+        catalog.states(),
+        format_func=lambda code: STATE_CODE_TO_NAME.get(code, code),
+    )
+    sort_order = sort_col.selectbox("Sort by:", list(SORT_ORDERS))
+    total_versions = catalog.count(search, state_filter)
+
+    if st.button("Rescan version folder"):
+        added, removed = catalog.sync(VERSION_FOLDER, read_version)
+        st.success(f"Catalog updated: {added} versions added, {removed} removed.")
+        total_versions = catalog.count(search, state_filter)
+
+    if not total_versions:
+        st.info("No versions match the filters." if search or state_filter else "No saved versions available.")
     else:
-        selected_version = st.selectbox("Choose a saved version to view:", saved_versions)
+        pages = -(-total_versions // VERSIONS_PER_PAGE)
+        page = st.number_input(f"Page (of {pages}):", min_value=1, max_value=pages, value=1) if pages > 1 else 1
+        entries = catalog.query(
+            search, state_filter, sort_order, VERSIONS_PER_PAGE, (page - 1) * VERSIONS_PER_PAGE
+        )
+        st.caption(
+            f"{total_versions} versions; showing {(page - 1) * VERSIONS_PER_PAGE + 1}-"
+            f"{(page - 1) * VERSIONS_PER_PAGE + len(entries)}."
+        )
+        st.dataframe(
+            pd.DataFrame({
+                "Name": [entry["name"] for entry in entries],
+                "Saved": [entry["created"].replace("T", " ") for entry in entries],
+                "States": [
+                    ", ".join(STATE_CODE_TO_NAME.get(code, code) for code in entry["states"].split(",") if code)
+                    for entry in entries
+                ],
+                "Features": [entry["feature_count"] for entry in entries],
+                "Size (KB)": [round(entry["size"] / 1024, 1) for entry in entries],
+                "Format": [entry["format"] for entry in entries],
+            }),
+            hide_index=True,
+        )
+        saved_versions = [entry["file"] for entry in entries]
+        version_digests = {entry["file"]: entry["sha256"] for entry in entries}
+
+        # Reports for many versions at once, rendered on the render pool
+        with st.expander("Batch export reports"):
+            batch_versions = st.multiselect("Versions to export (this page):", saved_versions, default=saved_versions)
+            batch_format = st.radio("Output:", ["Zip of PDFs", "One multi-page PDF"], horizontal=True)
+            batch_highlights = st.text_input("Comments for every page:")
+            if st.button("Export selected versions", disabled=not batch_versions):
+                export_format = "zip" if batch_format == "Zip of PDFs" else "pdf"
+                progress = st.progress(0.0)
+                buffer = io.BytesIO()
+                try:
+                    stats = export_versions(
+                        [os.path.join(VERSION_FOLDER, name) for name in batch_versions],
+                        buffer,
+                        export_format,
+                        highlights=batch_highlights,
+                        service=get_render_service(),
+                        on_progress=lambda done, total: progress.progress(done / total, text=f"{done}/{total} versions"),
+                        timeout=RENDER_TIMEOUT,
+                    )
+                    if stats["versions"]:
+                        st.session_state["batch_export"] = (buffer.getvalue(), export_format)
+                        st.success(
+                            f"Exported {stats['versions']} versions in {stats['seconds']:.1f}s "
+                            f"({stats['versions_per_second']:.2f} versions/s)."
+                        )
+                    else:
+                        st.session_state.pop("batch_export", None)
+                        st.error("None of the selected versions could be exported.")
+                    if stats["skipped"]:
+                        st.warning(
+                            f"Skipped {len(stats['skipped'])} versions:\n"
+                            + "\n".join(f"- {name}: {message}" for name, message in stats["skipped"])
+                        )
+                except RenderQueueFull as e:
+                    st.error(str(e))
+
+            # The archive is held only until it is downloaded
+            if "batch_export" in st.session_state:
+                batch_data, export_format = st.session_state["batch_export"]
+                st.download_button(
+                    label="Download batch export",
+                    data=lambda: batch_data,
+                    file_name=f"redistricting_reports.{export_format}",
+                    mime="application/zip" if export_format == "zip" else "application/pdf",
+                    on_click=lambda: st.session_state.pop("batch_export", None),
+                )
+
+        # Preselect the version this session saved last, when it is listed
+        last_saved = st.session_state["selected_version"]
+        selected_version = st.selectbox(
+            "Choose a saved version to view:",
+            saved_versions,
+            index=saved_versions.index(last_saved) if last_saved in saved_versions else 0,
+        )
         if selected_version:
             version_path = os.path.join(VERSION_FOLDER, selected_version)
             if os.path.exists(version_path):
-                version_gdf = load_geojson(version_path)
+                # FlatGeobuf versions can be loaded one state or one map view
+                # at a time, reading only those features through the file's
+                # spatial index
+                version_part = None
+                view_bbox = None
+                if supports_partial_reads(version_path):
+                    version_area = st.radio("Load:", VERSION_AREAS, horizontal=True)
+                    if version_area == "One state":
+                        area_state = st.selectbox(
+                            "State:",
+                            base_layer.states_in_data[1:],
+                            format_func=lambda code: STATE_CODE_TO_NAME.get(code, code),
+                        )
+                        version_part = (state_bbox(base_layer.state_metadata, area_state), (area_state,))
+                    elif version_area == "Current map view":
+                        if (
+                            st.button("Load features in the current view")
+                            or "version_view_bbox" not in st.session_state
+                        ):
+                            st.session_state["version_view_bbox"] = st.session_state.get("version_map_bbox")
+                        view_bbox = st.session_state["version_view_bbox"]
+                        if view_bbox is None:
+                            st.caption("Showing the whole version until the map has been moved.")
+                        else:
+                            version_part = (view_bbox, None)
+                version_gdf = load_geojson(version_path, version_part)
 
                 # Ensure columns for tooltip
                 for col in ["SalesRep", "Product"]:
@@ -540,12 +1426,21 @@ with tab_versions:
 
                 st.subheader(f"Map for `{selected_version}`")
 
+                if version_gdf.empty and version_part is not None:
+                    st.info("This version has no features in the selected area.")
+
                 if not version_gdf.empty:
-                    combined_geom = compute_union_all(version_gdf.geometry)
-                    if not combined_geom.is_empty:
-                        version_centroid = combined_geom.centroid
-                        map_location = [version_centroid.y, version_centroid.x]
-                        map_zoom = 6
+                    if version_part is None:
+                        version_metadata = load_version_metadata(version_path)
+                    else:
+                        version_metadata = build_state_metadata(version_gdf)
+                    version_location, version_bounds = map_framing(version_metadata, "All")
+                    if view_bbox is not None and version_part is not None:
+                        # Keep the view the features were loaded for
+                        minx, miny, maxx, maxy = view_bbox
+                        version_bounds = [[miny, minx], [maxy, maxx]]
+                    if version_location is not None:
+                        map_location, map_zoom = version_location, 6
                     else:
                         map_location, map_zoom = [39.833, -98.5795], 4
 
@@ -553,20 +1448,92 @@ with tab_versions:
                         location=map_location,
                         zoom_start=map_zoom,
                         width="100%",
-                        height="600",
+                        height=MAP_HEIGHT_PX,
                         tiles="OpenStreetMap",
                     )
+                    if version_bounds:
+                        m_version.fit_bounds(version_bounds)
+
+                    version_styled = with_style_columns(version_gdf, version=True)
+                    if render_mode == "Vector tiles":
+                        version_url = tile_server.register(
+                            f"version-{version_stem(selected_version)}",
+                            version_styled,
+                            TILE_PROPERTIES,
+                            token=f"{source_signature(version_path)}:{version_part}",
+                        )
+                        plugins.VectorGridProtobuf(
+                            TILE_SERVER_URL + version_url,
+                            "Version",
+                            vector_tile_options(),
+                        ).add_to(m_version)
+                        TileServerCheck(TILE_SERVER_URL).add_to(m_version)
+                    elif render_mode == "TopoJSON":
+                        topology_layer(
+                            load_version_topology(version_path, source_signature(version_path), version_part),
+                            "counties",
+                            style=DATA_DRIVEN_STYLE,
+                            tooltip=folium.GeoJsonTooltip(
+                                fields=["NAME", "SalesRep", "Product"],
+                                aliases=["County:", "Sales Rep:", "Product:"],
+                            ),
+                        ).add_to(m_version)
+                    else:
+                        version_map_gdf = version_styled
+                        # (the pyramid covers whole versions only)
+                        version_zoom = (
+                            fitted_zoom(version_bounds, MAP_MAX_WIDTH_PX, MAP_HEIGHT_PX) if version_bounds else map_zoom
+                        )
+                        lod_geometries = load_version_lod(version_path, version_zoom) if version_part is None else None
+                        if lod_geometries is not None:
+                            version_map_gdf[version_gdf.geometry.name] = gpd.GeoSeries(
+                                lod_geometries, index=version_gdf.index, crs=version_gdf.crs
+                            )
+                        styled_geojson(version_map_gdf).add_to(m_version)
+
+                    version_map_state = st_folium(m_version, width="100%", height=MAP_HEIGHT_PX)
+                    map_bbox = bounds_bbox((version_map_state or {}).get("bounds"))
+                    if map_bbox is not None:
+                        st.session_state["version_map_bbox"] = map_bbox
 
-                    folium.GeoJson(
-                        version_gdf.__geo_interface__,
-                        style_function=style_function_version,
-                        tooltip=folium.GeoJsonTooltip(
-                            fields=["NAME", "SalesRep", "Product"],
-                            aliases=["County:", "Sales Rep:", "Product:"],
-                        ),
-                    ).add_to(m_version)
-
-                    st_folium(m_version, width="100%", height=600)
+                    # -----------------------------------
+                    # Changes against another version
+                    # -----------------------------------
+                    with st.expander("Compare with another version"):
+                        compare_to = st.selectbox(
+                            "Show changes since:",
+                            [name for name in saved_versions if name != selected_version],
+                            index=None,
+                        )
+                        if compare_to:
+                            started = time.perf_counter()
+                            diff = load_version_diff(
+                                os.path.join(VERSION_FOLDER, compare_to),
+                                version_path,
+                                version_digests.get(compare_to),
+                                version_digests.get(selected_version),
+                            )
+                            elapsed_ms = (time.perf_counter() - started) * 1000
+                            summary = diff_summary(diff)
+                            for column, kind in zip(st.columns(len(CHANGE_KINDS)), CHANGE_KINDS):
+                                column.metric(kind.capitalize(), summary[kind])
+
+                            if diff.empty:
+                                st.info("No differences between these versions.")
+                            else:
+                                m_diff = folium.Map(
+                                    location=map_location,
+                                    zoom_start=map_zoom,
+                                    width="100%",
+                                    height="500",
+                                    tiles="OpenStreetMap",
+                                )
+                                minx, miny, maxx, maxy = diff.total_bounds
+                                m_diff.fit_bounds([[miny, minx], [maxy, maxx]])
+                                diff_layer(diff).add_to(m_diff)
+                                st_folium(m_diff, width="100%", height=500, key="version_diff_map")
+                                st.dataframe(diff.drop(columns=diff.geometry.name), hide_index=True)
+                            st.caption(f"Diff computed in {elapsed_ms:.0f} ms.")
 
                     # -----------------------------------
                     # PDF Highlights / Comments Section
@@ -588,27 +1555,43 @@ with tab_versions:
                         on_change=update_text
                     )
 
-                    # 4) When generating PDF, use the latest text from session_state
-                    pdf_data = generate_pdf(
-                        generate_map_snapshot(version_gdf, title=""),
-                        selected_version,
-                        st.session_state["pdf_highlights"],  # <<--- Updated here
-                    )
+                    # 4) The PDF is built only when the download is clicked, from the
+                    # latest text in session_state, and cached on disk by (version
+                    # contents, highlights, PDF settings)
+                    highlights = st.session_state["pdf_highlights"]
+                    pdf_key = version_pdf_key(version_path, selected_version, highlights)
 
                     # 5) Provide the download button as before
-                    if pdf_data:
-                        st.download_button(
-                            label="Export PDF",
-                            data=pdf_data,
-                            file_name=f"redistricting_report_{selected_version}.pdf",
-                            mime="application/pdf",
-                        )
-                        st.success("PDF download ready.")
-                    else:
-                        st.error("Failed to generate PDF.")
+                    st.download_button(
+                        label="Export PDF",
+                        data=lambda: cached_export(
+                            pdf_key,
+                            "pdf",
+                            lambda: build_version_pdf(load_geojson(version_path), selected_version, highlights),
+                        ),
+                        file_name=f"redistricting_report_{selected_version}.pdf",
+                        mime="application/pdf",
+                    )
+                    if os.path.exists(cached_export_path(pdf_key, "pdf")):
+                        st.caption("This export is cached and downloads instantly.")
+                    st.download_button(
+                        label="Export GeoJSON",
+                        data=lambda: load_geojson(version_path).to_json(drop_id=True),
+                        file_name=f"{version_stem(selected_version)}.geojson",
+                        mime="application/geo+json",
+                    )
+                    render_metrics = get_render_service().metrics()
+                    if render_metrics["queue_depth"] >= render_metrics["max_queue"]:
+                        st.warning("The render queue is full; new exports wait for a free slot.")
+                    st.caption(render_pool_status(render_metrics))
+                    st.caption(version_cache_status(get_version_cache().stats()))
+
+with tab_versions:
+    versions_tab()
 
 # ===================== TAB: UPLOAD DATA =====================
-with tab_upload:
+@timed_fragment("Upload")
+def upload_tab():
     st.header("Upload Proposed Changes")
     st.write(
         """
@@ -645,3 +1628,6 @@ with tab_upload:
             # insert_into_staging_table(df_uploaded)
             st.info("Data is ready for processing.")
             st.dataframe(df_uploaded)
+
+with tab_upload:
+    upload_tab()
@@ -0,0 +1,415 @@
+# -------------------------------------------------------------------
+# Render service: map snapshots and PDFs in a worker process pool
+# -------------------------------------------------------------------
+# matplotlib rendering is CPU-bound and holds the GIL, so renders running
+# on Streamlit's session threads slow each other (and every other session)
+# down. Render jobs run here instead, in separate worker processes that
+# draw with the Agg backend directly.
+#
+# Jobs wait in a bounded priority queue in the parent process; a
+# dispatcher hands the highest-priority job to the pool whenever a worker
+# is free. When the queue is full, submit() blocks for up to its timeout
+# and then raises RenderQueueFull (backpressure instead of an unbounded
+# backlog). metrics() reports queue depth, throughput and latency.
+#
+# If a worker process dies (out of memory, crash), the pool is broken for
+# good: the jobs it was running fail, and the pool is replaced so that
+# later jobs run on fresh workers.
+import heapq
+import io
+import itertools
+import multiprocessing
+import sys
+import threading
+import time
+import types
+
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+import shapely
+
+from fpdf import FPDF
+from fpdf.enums import XPos, YPos
+from matplotlib.collections import PathCollection
+from matplotlib.figure import Figure
+from matplotlib.path import Path
+
+from version_store import read_version
+
+# Lower number = served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+LATENCY_SAMPLES = 500
+
+# Everything besides the version contents and highlights that shapes an
+# exported PDF; part of the export cache key (bump "layout" on changes)
+PDF_EXPORT_SETTINGS = {"layout": 3, "snapshot_title": "", "figsize": [8, 6]}
+
+
+class RenderQueueFull(RuntimeError):
+    """
+    Raised by RenderService.submit when the queue stays full for the
+    whole timeout.
+    """
+
+
+# -------------------------------------------------------------------
+# Render jobs (run inside the worker processes)
+# -------------------------------------------------------------------
+def polygon_paths(geometries):
+    """
+    One compound matplotlib Path per geometry (all rings of all its
+    polygon parts, holes included), built from flat coordinate arrays.
+    Empty or missing geometries give an empty path.
+    """
+    parts, part_geom = shapely.get_parts(geometries, return_index=True)
+    rings, ring_part = shapely.get_rings(parts, return_index=True)
+    coords, point_ring = shapely.get_coordinates(rings, return_index=True)
+
+    codes = np.full(len(coords), Path.LINETO, dtype=Path.code_type)
+    if len(coords):
+        ring_start = np.r_[True, point_ring[1:] != point_ring[:-1]]
+        ring_end = np.r_[point_ring[1:] != point_ring[:-1], True]
+        codes[ring_start] = Path.MOVETO
+        codes[ring_end] = Path.CLOSEPOLY
+
+    point_geom = part_geom[ring_part[point_ring]]
+    splits = np.searchsorted(point_geom, np.arange(1, len(geometries)))
+    return [
+        Path(vertices, path_codes)
+        for vertices, path_codes in zip(np.split(coords, splits), np.split(codes, splits))
+    ]
+
+
+def draw_polygons(ax, gdf, facecolors, edgecolor="black", alpha=0.6, linewidth=1.0, pixel_tolerance=0.5):
+    """
+    Draw a polygon layer as a single PathCollection (one artist for the
+    whole layer, instead of one patch per polygon as in GeoDataFrame.plot).
+    With pixel_tolerance set, geometries are first simplified to that many
+    output pixels, so detail the output resolution cannot show is never
+    drawn. Autoscales the axes to the layer bounds (with default margins).
+    """
+    geometries = np.asarray(gdf.geometry.values, dtype=object)
+    minx, miny, maxx, maxy = shapely.total_bounds(geometries)
+
+    if pixel_tolerance:
+        fig = ax.get_figure()
+        width_px = fig.get_figwidth() * fig.dpi * ax.get_position().width
+        height_px = fig.get_figheight() * fig.dpi * ax.get_position().height
+        units_per_px = max((maxx - minx) / width_px, (maxy - miny) / height_px)
+        # Plain Douglas-Peucker: far cheaper than the topology-preserving
+        # variant, and anything it collapses is below pixel size anyway
+        geometries = shapely.simplify(geometries, units_per_px * pixel_tolerance, preserve_topology=False)
+
+    collection = PathCollection(
+        polygon_paths(geometries),
+        facecolors=list(facecolors),
+        edgecolors=edgecolor,
+        linewidths=linewidth,
+        alpha=alpha,
+    )
+    ax.update_datalim([(minx, miny), (maxx, maxy)])
+    ax.add_collection(collection, autolim=False)
+    ax.autoscale_view()
+    return collection
+
+
+def generate_map_snapshot(gdf, title="Proposed Districts Snapshot", figsize=(8, 6), fast=True):
+    """
+    Generate a PNG snapshot of a GeoDataFrame with matplotlib.
+    Return an in-memory buffer for further usage (e.g., embedding in PDF).
+    Uses a standalone Figure (no pyplot global state).
+    - fast=True: polygon layers go through draw_polygons (one artist,
+      pixel-aware simplification); other layers fall back to gdf.plot.
+    """
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    if gdf.empty:
+        ax.text(0.5, 0.5, "No geometry to display", ha="center", va="center")
+        ax.axis("off")
+    else:
+        polygonal = gdf.geometry.isna() | gdf.geom_type.isin(["Polygon", "MultiPolygon"])
+        if fast and polygonal.all():
+            ax.set_aspect("equal")
+            draw_polygons(ax, gdf, gdf["color"])
+        else:
+            gdf.plot(ax=ax, edgecolor="black", color=gdf["color"], alpha=0.6)
+        ax.set_title(title)
+        ax.axis("off")
+        ax.set_aspect("equal")
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    buf.seek(0)
+    return buf
+
+
+def add_report_page(pdf, map_png, version_name, highlights):
+    """
+    Append one report page (title, version name, map snapshot, comments)
+    to an FPDF document.
+    """
+    pdf.add_page()
+
+    pdf.set_font("Helvetica", "B", 16)
+    pdf.cell(0, 10, "Territory Plan", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align="C")
+
+    pdf.set_font("Helvetica", "B", 12)
+    pdf.cell(0, 10, f"Version: {version_name}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+    page_width = 297
+    margin = 10
+    map_width = int(page_width * 0.7) - (2 * margin)
+    comments_width = int(page_width * 0.3) - margin
+    map_x = margin
+    map_y = pdf.get_y()
+    pdf.image(map_png, x=map_x, y=map_y, w=map_width)
+
+    pdf.set_xy(map_x + map_width + margin, map_y)
+    pdf.set_font("Helvetica", "I", 10)
+    pdf.multi_cell(comments_width, 10, f"Comments: {highlights}")
+
+
+def new_report_document():
+    return FPDF(orientation="L", unit="mm", format="A4")
+
+
+def generate_pdf(map_png, version_name, highlights):
+    """
+    Create an in-memory PDF with the provided map snapshot, version text, etc.
+    The snapshot buffer goes straight into the PDF; nothing touches disk.
+    """
+    if not map_png:
+        return None
+    pdf = new_report_document()
+    add_report_page(pdf, map_png, version_name, highlights)
+    return io.BytesIO(bytes(pdf.output()))
+
+
+def render_version_pdf(gdf, version_name, highlights, title="", figsize=(8, 6)):
+    """
+    Job: snapshot + PDF for a version, as bytes.
+    """
+    snapshot = generate_map_snapshot(gdf, title=title, figsize=tuple(figsize))
+    return generate_pdf(snapshot, version_name, highlights).getvalue()
+
+
+def _version_file_snapshot(version_path, default_color, title, figsize):
+    gdf = read_version(version_path)
+    if "color" in gdf.columns:
+        gdf["color"] = gdf["color"].fillna(default_color)
+    else:
+        gdf["color"] = default_color
+    return generate_map_snapshot(gdf, title=title, figsize=tuple(figsize))
+
+
+def render_version_file_snapshot(version_path, default_color, title="", figsize=(8, 6)):
+    """
+    Job: read a version file (either format) inside the worker and
+    return its PNG snapshot as bytes.
+    """
+    return _version_file_snapshot(version_path, default_color, title, figsize).getvalue()
+
+
+def render_version_file_pdf(version_path, version_name, highlights, default_color, title="", figsize=(8, 6)):
+    """
+    Job: read a version file inside the worker and return its report PDF
+    as bytes.
+    """
+    snapshot = _version_file_snapshot(version_path, default_color, title, figsize)
+    return generate_pdf(snapshot, version_name, highlights).getvalue()
+
+
+def _init_worker():
+    matplotlib.use("Agg")
+
+
+@contextmanager
+def _main_module_hidden():
+    """
+    Hide the __main__ module while worker processes may be spawned.
+    Spawned children re-run the parent's __main__ file; under Streamlit
+    that is the app script itself. Another thread may install a new
+    __main__ meanwhile (Streamlit does on every script run); that one is
+    left in place.
+    """
+    main_module = sys.modules.get("__main__")
+    stub = types.ModuleType("__main__")
+    sys.modules["__main__"] = stub
+    try:
+        yield
+    finally:
+        if sys.modules.get("__main__") is stub:
+            sys.modules["__main__"] = main_module
+
+
+# -------------------------------------------------------------------
+# Pool with a bounded priority queue
+# -------------------------------------------------------------------
+class RenderService:
+    """
+    Process pool for render jobs with a bounded priority queue in front.
+    - submit(fn, *args, priority=..., timeout=...) -> concurrent Future
+    - metrics() -> dict of queue depth, counters and latency percentiles
+    fn and its arguments must be picklable (module-level functions).
+    """
+
+    def __init__(self, workers=2, max_queue=32):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = self._new_executor()
+        self._heap = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_ms = deque(maxlen=LATENCY_SAMPLES)
+        self._render_ms = deque(maxlen=LATENCY_SAMPLES)
+        self._closed = False
+        threading.Thread(target=self._dispatch, name="render-dispatch", daemon=True).start()
+
+    def _new_executor(self):
+        # spawn: forking a process that runs server threads is unsafe
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    def _replace_executor(self, broken):
+        """
+        Swap in a new pool if broken is still the current one (several
+        failed jobs may report the same broken pool).
+        """
+        with self._cond:
+            if self._executor is not broken or self._closed:
+                return
+            self._executor = self._new_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, fn, *args, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """
+        Queue a job. Blocks while the queue is full, up to timeout seconds
+        (None = wait indefinitely), then raises RenderQueueFull.
+        """
+        future = Future()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while len(self._heap) >= self.max_queue and not self._closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._rejected += 1
+                    raise RenderQueueFull(
+                        f"Render queue full ({self.max_queue} jobs waiting); try again shortly."
+                    )
+                self._cond.wait(remaining)
+            if self._closed:
+                raise RuntimeError("Render service is shut down.")
+            heapq.heappush(self._heap, (priority, next(self._order), time.perf_counter(), fn, args, future))
+            self._cond.notify_all()
+        return future
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while not self._closed and (not self._heap or self._in_flight >= self.workers):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                _, _, queued_at, fn, args, future = heapq.heappop(self._heap)
+                self._in_flight += 1
+                self._cond.notify_all()
+                executor = self._executor
+
+            started_at = time.perf_counter()
+            try:
+                # (the executor starts worker processes on demand in submit)
+                with _main_module_hidden():
+                    job = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                # The pool broke before this job started: run it on a new one
+                self._replace_executor(executor)
+                with self._cond:
+                    executor = self._executor
+                try:
+                    with _main_module_hidden():
+                        job = executor.submit(fn, *args)
+                except Exception as e:
+                    self._finish(future, queued_at, started_at, error=e)
+                    continue
+            except Exception as e:
+                self._finish(future, queued_at, started_at, error=e)
+                continue
+            job.add_done_callback(
+                lambda job, future=future, queued_at=queued_at, started_at=started_at, executor=executor: self._finish(
+                    future, queued_at, started_at, job=job, executor=executor
+                )
+            )
+
+    def _finish(self, future, queued_at, started_at, job=None, error=None, executor=None):
+        if job is not None:
+            error = job.exception()
+            if isinstance(error, BrokenProcessPool):
+                self._replace_executor(executor)
+        done_at = time.perf_counter()
+        with self._cond:
+            self._in_flight -= 1
+            self._wait_ms.append((started_at - queued_at) * 1000)
+            self._render_ms.append((done_at - started_at) * 1000)
+            if error is None:
+                self._completed += 1
+            else:
+                self._failed += 1
+            self._cond.notify_all()
+        if error is None:
+            future.set_result(job.result())
+        else:
+            future.set_exception(error)
+
+    def metrics(self):
+        """
+        Snapshot of queue depth, job counters and latency percentiles (ms)
+        over the last LATENCY_SAMPLES jobs.
+        """
+        with self._cond:
+            wait_ms, render_ms = list(self._wait_ms), list(self._render_ms)
+            metrics = {
+                "workers": self.workers,
+                "queue_depth": len(self._heap),
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+        for name, samples in (("wait", wait_ms), ("render", render_ms)):
+            for pct in (50, 95):
+                metrics[f"{name}_p{pct}_ms"] = _percentile(samples, pct)
+        return metrics
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            pending, self._heap = self._heap, []
+            self._cond.notify_all()
+        for *_, future in pending:
+            future.cancel()
+        self._executor.shutdown(wait=True)
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
@@ -0,0 +1,158 @@
+# -------------------------------------------------------------------
+# Base layer documents served from the app's own origin
+# -------------------------------------------------------------------
+# GeoJSON / TopoJSON base layers are written once per version into the
+# app's static folder, which Streamlit serves at /app/static/ when
+# server.enableStaticServing is on (see .streamlit/config.toml). The map
+# then loads its base layer from a versioned URL on the same host, port
+# and scheme as the page: it stays byte-identical across reruns, the
+# browser downloads each layer once per version, and there is no second
+# port to expose or mixed content to block.
+import hashlib
+import os
+import re
+import threading
+
+from folium.elements import JSCSSMixin
+from folium.map import MacroElement
+from jinja2 import Template
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL_PATH = "app/static"
+STATIC_VERSIONS_KEPT = 2  # per document name; older versions are removed
+
+
+class StaticDocuments:
+    """
+    Versioned documents in the static folder.
+    - publish(name, token, build) -> URL path of the document version,
+      writing it (atomically) only if that version is not on disk yet
+    Every version is its own file ("<stem>-<token hash><suffix>"), so a page
+    holding an older URL keeps loading the data it was built with until the
+    version is pruned.
+    """
+
+    def __init__(self, folder=STATIC_FOLDER, base_url_path=""):
+        self.folder = folder
+        self.url_prefix = "/" + "/".join(p for p in (base_url_path.strip("/"), STATIC_URL_PATH) if p)
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def publish(self, name, token, build):
+        """
+        build() returns the payload as bytes; it is only called for a
+        version that is not on disk yet, so unchanged layers cost nothing on
+        rerun.
+        """
+        stem, suffix = os.path.splitext(name)
+        file_name = f"{stem}-{hashlib.sha1(str(token).encode('utf-8')).hexdigest()[:16]}{suffix}"
+        path = os.path.join(self.folder, file_name)
+        if not os.path.exists(path):
+            payload = build()
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(payload)
+            os.replace(temp_path, path)
+            self._prune(stem, suffix)
+        return f"{self.url_prefix}/{file_name}"
+
+    def _prune(self, stem, suffix):
+        pattern = re.compile(re.escape(stem) + r"-[0-9a-f]{16}" + re.escape(suffix))
+        with self._lock:
+            versions = [os.path.join(self.folder, f) for f in os.listdir(self.folder) if pattern.fullmatch(f)]
+            versions.sort(key=os.path.getmtime, reverse=True)
+            for old in versions[STATIC_VERSIONS_KEPT:]:
+                try:
+                    os.remove(old)
+                except FileNotFoundError:
+                    pass
+
+
+def map_notice_js(map_name, message_js):
+    """
+    JavaScript adding a notice box to a Leaflet map; message_js is a
+    JavaScript string expression.
+    """
+    return f"""
+        var notice = L.control({{position: "topright"}});
+        notice.onAdd = function() {{
+            var div = L.DomUtil.create("div", "leaflet-bar");
+            div.style.background = "white";
+            div.style.padding = "4px 8px";
+            div.textContent = {message_js};
+            return div;
+        }};
+        notice.addTo({map_name});
+    """
+
+
+# -------------------------------------------------------------------
+# Client side: Leaflet layer loaded from a served document
+# -------------------------------------------------------------------
+class RemoteGeoJson(JSCSSMixin, MacroElement):
+    """
+    Leaflet GeoJSON layer whose data is fetched from a URL (see
+    StaticDocuments.publish) instead of being embedded in the page.
+    - style: JavaScript style function of the feature.
+    - object_name: set for TopoJSON documents (decoded with topojson.feature).
+    - fields / aliases: feature properties shown in a hover tooltip.
+    If the document cannot be fetched, the map shows a notice instead of
+    silently staying empty.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.geoJson(null, {
+                style: {{ this.style_js }},
+            {%- if this.fields %}
+                onEachFeature: function(feature, layer) {
+                    var fields = {{ this.fields|tojson }};
+                    var aliases = {{ this.aliases|tojson }};
+                    var rows = fields.map(function(field, i) {
+                        var value = feature.properties[field];
+                        value = (value === null || value === undefined) ? "" : String(value);
+                        value = value.replace(/[&<>"]/g, function(c) { return "&#" + c.charCodeAt(0) + ";"; });
+                        return "<tr><th>" + aliases[i] + "</th><td>" + value + "</td></tr>";
+                    });
+                    layer.bindTooltip("<table>" + rows.join("") + "</table>", {sticky: true});
+                },
+            {%- endif %}
+            }).addTo({{ this._parent.get_name() }});
+            fetch({{ this.url|tojson }})
+                .then(function(response) {
+                    if (!response.ok) { throw new Error("HTTP " + response.status); }
+                    return response.json();
+                })
+                .then(function(data) {
+                {%- if this.object_name %}
+                    data = topojson.feature(data, data.objects[{{ this.object_name|tojson }}]);
+                {%- endif %}
+                    {{ this.get_name() }}.addData(data);
+                })
+                .catch(function(error) {
+                    console.error("Layer could not be loaded from " + {{ this.url|tojson }}, error);
+                    {{ this.notice_js(this._parent.get_name()) }}
+                });
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, url, style, object_name=None, fields=None, aliases=None):
+        super().__init__()
+        self._name = "RemoteGeoJson"
+        self.url = url
+        self.style_js = style
+        self.object_name = object_name
+        self.fields = list(fields or [])
+        self.aliases = list(aliases or self.fields)
+        self.default_js = (
+            [("topojson", "https://cdnjs.cloudflare.com/ajax/libs/topojson/1.6.9/topojson.min.js")]
+            if object_name else []
+        )
+
+    @staticmethod
+    def notice_js(map_name):
+        return map_notice_js(
+            map_name, '"Map layer unavailable (" + error.message + "). Reload the page or send map layers as GeoJSON."'
+        )
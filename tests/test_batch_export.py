@@ -0,0 +1,44 @@
+"""
+A version that cannot be read is skipped and reported; the rest of the
+batch is still exported, with the zip's PDFs built on the render pool.
+"""
+import io
+import zipfile
+
+import geopandas as gpd
+import pytest
+
+from shapely.geometry import box
+
+from batch_export import export_versions
+from render_service import RenderService
+
+
+@pytest.fixture(scope="module")
+def service():
+    service = RenderService(workers=1, max_queue=4)
+    yield service
+    service.shutdown()
+
+
+@pytest.fixture
+def version_paths(tmp_path):
+    good = tmp_path / "Good_20250101_120000.geojson"
+    gpd.GeoDataFrame({"NAME": ["A"]}, geometry=[box(0, 0, 1, 1)], crs="EPSG:4326").to_file(good, driver="GeoJSON")
+    broken = tmp_path / "Broken_20250101_120000.geojson"
+    broken.write_text("not a version", encoding="utf-8")
+    return [str(good), str(broken)]
+
+
+@pytest.mark.parametrize("export_format", ["zip", "pdf"])
+def test_unreadable_version_is_skipped(service, version_paths, export_format):
+    buffer = io.BytesIO()
+    stats = export_versions(version_paths, buffer, export_format, service=service, timeout=60)
+
+    assert stats["versions"] == 1
+    assert [name for name, _ in stats["skipped"]] == ["Broken_20250101_120000.geojson"]
+    if export_format == "zip":
+        with zipfile.ZipFile(buffer) as archive:
+            assert archive.namelist() == ["redistricting_report_Good_20250101_120000.geojson.pdf"]
+    else:
+        assert buffer.getvalue().startswith(b"%PDF")
@@ -0,0 +1,64 @@
+"""
+Many sessions exporting PDFs at once: every export must get its own map
+and text, and nothing may be written to the working directory.
+"""
+import os
+import re
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+import geopandas as gpd
+import pytest
+
+from shapely.geometry import box
+
+from render_service import generate_map_snapshot, generate_pdf
+
+EXPORTS = 32
+THREADS = 8
+
+
+def pdf_text(pdf_bytes):
+    """
+    Concatenated content streams of a PDF (decompressed where needed).
+    """
+    streams = re.findall(rb"stream\r?\n(.*?)\r?\nendstream", pdf_bytes, re.S)
+    text = []
+    for stream in streams:
+        try:
+            text.append(zlib.decompress(stream))
+        except zlib.error:
+            text.append(stream)
+    return b"".join(text)
+
+
+def export(i):
+    gdf = gpd.GeoDataFrame(
+        {"color": ["#ff0000", "#00ff00"]},
+        geometry=[box(i, 0, i + 1, 1), box(i + 1, 0, i + 2, 2)],
+        crs="EPSG:4326",
+    )
+    snapshot = generate_map_snapshot(gdf, title=f"Snapshot {i}")
+    return generate_pdf(snapshot, f"Version {i:03d}", f"Highlights for export {i:03d}").getvalue()
+
+
+@pytest.fixture
+def empty_workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_concurrent_exports_are_isolated(empty_workdir):
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        pdfs = list(pool.map(export, range(EXPORTS)))
+
+    for i, pdf in enumerate(pdfs):
+        assert pdf.startswith(b"%PDF")
+        text = pdf_text(pdf)
+        assert f"Version {i:03d}".encode() in text
+        assert f"Highlights for export {i:03d}".encode() in text
+        others = [j for j in range(EXPORTS) if j != i and f"Version {j:03d}".encode() in text]
+        assert not others
+
+    assert os.listdir(empty_workdir) == []
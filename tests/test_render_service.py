@@ -0,0 +1,31 @@
+"""
+A worker process dying must fail only the job it was running; later jobs
+run on a fresh pool.
+"""
+import os
+
+import pytest
+
+from concurrent.futures.process import BrokenProcessPool
+
+from render_service import RenderService
+
+
+@pytest.fixture
+def service():
+    service = RenderService(workers=1, max_queue=4)
+    yield service
+    service.shutdown()
+
+
+def test_pool_recovers_after_worker_crash(service):
+    assert service.submit(pow, 2, 10).result(timeout=60) == 1024
+
+    crashed = service.submit(os._exit, 1)
+    with pytest.raises(BrokenProcessPool):
+        crashed.result(timeout=60)
+
+    assert service.submit(pow, 3, 3).result(timeout=60) == 27
+    metrics = service.metrics()
+    assert metrics["completed"] == 2
+    assert metrics["failed"] == 1
@@ -0,0 +1,53 @@
+"""
+Two versions registered under the same name must each serve their own
+features, and a request for a token that is not registered gets a 404.
+"""
+import urllib.error
+import urllib.request
+
+import geopandas as gpd
+import mapbox_vector_tile
+import pytest
+
+from shapely.geometry import box
+
+from tile_server import TILE_LAYER_NAME, TileServer
+
+
+@pytest.fixture
+def server():
+    server = TileServer(port=0).start()
+    server.port = server._httpd.server_address[1]
+    yield server
+    server._httpd.shutdown()
+
+
+def layer(name):
+    return gpd.GeoDataFrame({"NAME": [name]}, geometry=[box(-10, -10, 10, 10)], crs="EPSG:4326")
+
+
+def fetch(server, path):
+    with urllib.request.urlopen(f"http://127.0.0.1:{server.port}{path}", timeout=10) as response:
+        return response.read()
+
+
+def tile_names(data):
+    return [f["properties"]["NAME"] for f in mapbox_vector_tile.decode(data)[TILE_LAYER_NAME]["features"]]
+
+
+def test_versions_of_one_name_are_served_side_by_side(server):
+    first = server.register("version-a", layer("first"), ["NAME"], token="sig:0")
+    second = server.register("version-a", layer("second"), ["NAME"], token="sig:1")
+    tile = "/0/0/0.pbf"
+
+    assert tile_names(fetch(server, first.replace("/{z}/{x}/{y}.pbf", tile))) == ["first"]
+    assert tile_names(fetch(server, second.replace("/{z}/{x}/{y}.pbf", tile))) == ["second"]
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        fetch(server, f"/version-a{tile}?v=sig:2")
+    assert error.value.code == 404
+
+
+def test_root_answers_reachability_check(server):
+    with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/", timeout=10) as response:
+        assert response.status == 204
@@ -0,0 +1,130 @@
+"""
+Delta versions: what is saved must read back unchanged, format 1 files
+must stay readable, and a missing base snapshot must be reported as such.
+"""
+import json
+import os
+import shutil
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+
+from geopandas.testing import assert_geodataframe_equal
+from shapely.geometry import box
+
+from export_cache import file_digest
+from geometry_store import geometry_store_for
+from version_store import (
+    BASE_FOLDER,
+    VersionBaseMissing,
+    decode_delta,
+    encode_delta,
+    load_base,
+    read_delta,
+    read_version,
+    write_delta_version_atomic,
+)
+
+
+@pytest.fixture
+def base_file(tmp_path):
+    base = gpd.GeoDataFrame(
+        {
+            "STATEFP": ["48", "48", "48", "06", "06", "06"],
+            "GEOID": ["48001", "48003", "48005", "06001", "06003", "06005"],
+            "NAME": ["Anderson", "Andrews", "Angelina", "Alameda", "Alpine", "Amador"],
+            "ALAND": [100, 200, 300, 400, 500, 600],
+        },
+        geometry=[box(i, 0, i + 1, 1) for i in range(6)],
+        crs="EPSG:4326",
+    )
+    path = tmp_path / "input" / "counties.geojson"
+    path.parent.mkdir()
+    base.to_file(path, driver="GeoJSON")
+    return str(path)
+
+
+@pytest.fixture
+def version_folder(tmp_path):
+    folder = tmp_path / "output"
+    folder.mkdir()
+    return folder
+
+
+def edited_version(base_file):
+    """
+    The base layer reordered, with one county dropped, attributes set on
+    most rows (one differing) and two drawn polygons added.
+    """
+    base = gpd.read_file(base_file)
+    gdf = base.iloc[[2, 0, 1, 4, 5]].reset_index(drop=True)
+    gdf["color"] = "#B58264"
+    gdf.loc[3, "color"] = "#ff0000"
+    gdf["SalesRep"] = None
+    gdf.loc[0, "SalesRep"] = "Ann"
+    drawn = gpd.GeoDataFrame(
+        {"STATEFP": ["48", None], "NAME": ["Anderson (Proposed)", "Anderson (Proposed)"],
+         "color": ["#00ff00", "#0000ff"]},
+        geometry=[box(0.5, 0.5, 2.5, 1.5), box(10, 10, 11, 11)],
+        crs=base.crs,
+    )
+    edited = pd.concat([gdf.iloc[:2], drawn.iloc[:1], gdf.iloc[2:], drawn.iloc[1:]], ignore_index=True)
+    return gpd.GeoDataFrame(edited, crs=base.crs).infer_objects()
+
+
+def test_delta_round_trip(base_file, version_folder):
+    gdf = edited_version(base_file)
+    version_file = str(version_folder / "Draft_20250101_120000.delta.json")
+    write_delta_version_atomic(gdf, version_file, base_file, cache_folder=str(version_folder / "cache"))
+
+    with open(version_file, encoding="utf-8") as file:
+        delta = json.load(file)
+    # Unchanged base rows are stored as positions, drawn polygons whole
+    assert delta["order"][:2] == [2, 0]
+    assert len(delta["added"]["geometry"]) == 2
+
+    assert_geodataframe_equal(read_version(version_file), gdf, check_dtype=False)
+
+
+def test_encode_decode_in_memory(base_file, version_folder):
+    base = gpd.read_file(base_file)
+    gdf = edited_version(base_file)
+    store = geometry_store_for(str(version_folder))
+
+    delta = encode_delta(gdf, base, {"file": "counties.geojson", "sha256": "x"}, store)
+    decoded = decode_delta(json.loads(json.dumps(delta)), base, store)
+
+    assert_geodataframe_equal(decoded, gdf, check_dtype=False)
+
+
+def test_format_1_still_readable(base_file, version_folder):
+    # Format 1: GeoParquet base snapshot, added rows as GeoJSON features
+    base = gpd.read_file(base_file)
+    digest = file_digest(base_file)
+    os.makedirs(version_folder / BASE_FOLDER)
+    base.to_parquet(version_folder / BASE_FOLDER / f"{digest}.parquet", index=False)
+
+    gdf = edited_version(base_file)
+    delta = encode_delta(gdf, base, {"file": "counties.geojson", "sha256": digest},
+                         geometry_store_for(str(version_folder)))
+    is_added = np.asarray(delta["order"]) < 0
+    delta["format_version"] = 1
+    delta["added"] = json.loads(gdf[is_added].to_json(drop_id=True))
+    version_file = version_folder / "Legacy_20240101_120000.delta.json"
+    version_file.write_text(json.dumps(delta), encoding="utf-8")
+
+    assert_geodataframe_equal(read_delta(str(version_file)), gdf, check_dtype=False)
+
+
+def test_missing_base_raises(base_file, version_folder):
+    version_file = str(version_folder / "Draft_20250101_120000.delta.json")
+    write_delta_version_atomic(
+        edited_version(base_file), version_file, base_file, cache_folder=str(version_folder / "cache")
+    )
+    shutil.rmtree(version_folder / BASE_FOLDER)
+    load_base.cache_clear()
+
+    with pytest.raises(VersionBaseMissing):
+        read_version(version_file)
@@ -0,0 +1,290 @@
+# -------------------------------------------------------------------
+# Local vector tile (MVT) server
+# -------------------------------------------------------------------
+# Serves registered GeoDataFrames as Mapbox Vector Tiles from a small
+# background HTTP server, so the browser only downloads the tiles that are
+# visible at the current zoom instead of the whole layer as GeoJSON.
+#
+# URL scheme: /<layer>/<z>/<x>/<y>.pbf?v=<token>
+# Every tile contains a single MVT layer named TILE_LAYER_NAME. The root
+# path / answers 204, so the page can check that it reaches the server.
+# (Whole-layer GeoJSON / TopoJSON documents are served from the app's own
+# origin instead, see static_layers.py.)
+import threading
+
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote
+
+import mapbox_vector_tile
+import numpy as np
+import shapely
+
+from folium.map import MacroElement
+from jinja2 import Template
+
+from static_layers import map_notice_js
+from version_cache import GEOMETRY_OVERHEAD_BYTES
+
+TILE_LAYER_NAME = "features"
+TILE_EXTENT = 4096
+TILE_BUFFER = 64  # in tile units, hides seams between neighbouring tiles
+TILE_CACHE_SIZE = 4096
+REGISTRY_MAX_BYTES = 256 * 1024 * 1024  # registered layers
+# Per feature: properties dict and STRtree entry (calibrated against process
+# RSS growth when registering counties_0)
+TILE_FEATURE_OVERHEAD_BYTES = 512
+WEB_MERCATOR_HALF_WORLD = 20037508.342789244
+
+
+def tile_bounds(z, x, y):
+    """
+    Web Mercator bounds (minx, miny, maxx, maxy) of an XYZ tile.
+    """
+    tile_size = 2 * WEB_MERCATOR_HALF_WORLD / (2 ** z)
+    minx = -WEB_MERCATOR_HALF_WORLD + x * tile_size
+    maxy = WEB_MERCATOR_HALF_WORLD - y * tile_size
+    return minx, maxy - tile_size, minx + tile_size, maxy
+
+
+class TileLayer:
+    """
+    A GeoDataFrame prepared for tiling: projected to Web Mercator once,
+    indexed with an STRtree, and with feature properties pre-converted to
+    plain Python values.
+    """
+
+    def __init__(self, gdf, properties):
+        if gdf.crs is None:
+            gdf = gdf.set_crs(epsg=4326)
+        projected = gdf.to_crs(epsg=3857)
+        self.geometries = np.asarray(projected.geometry.values, dtype=object)
+        columns = [col for col in properties if col in projected.columns]
+        self.properties = (
+            projected[columns]
+            .astype(object)
+            .where(projected[columns].notna(), None)
+            .to_dict(orient="records")
+        )
+        self.tree = shapely.STRtree(self.geometries)
+        self.nbytes = self._estimate_nbytes(projected[columns])
+
+    def _estimate_nbytes(self, attributes):
+        """
+        Approximate memory held: coordinates and GEOS objects, property
+        values, and a per-feature overhead (property dict, STRtree entry).
+        """
+        coordinates = int(shapely.get_num_coordinates(self.geometries).sum())
+        objects = len(self.geometries) + int(shapely.get_num_geometries(self.geometries).sum())
+        return (
+            coordinates * 16
+            + objects * GEOMETRY_OVERHEAD_BYTES
+            + len(self.geometries) * TILE_FEATURE_OVERHEAD_BYTES
+            + int(attributes.memory_usage(index=False, deep=True).sum())
+        )
+
+    def encode(self, z, x, y):
+        """
+        Encode one tile. Geometries are simplified to the tile's pixel grid
+        and clipped to the (buffered) tile before encoding.
+        """
+        minx, miny, maxx, maxy = tile_bounds(z, x, y)
+        unit = (maxx - minx) / TILE_EXTENT
+        pad = TILE_BUFFER * unit
+        clip_box = (minx - pad, miny - pad, maxx + pad, maxy + pad)
+
+        hits = self.tree.query(shapely.box(*clip_box), predicate="intersects")
+        if hits.size == 0:
+            return b""
+
+        geoms = shapely.simplify(self.geometries[hits], unit, preserve_topology=True)
+        geoms = shapely.clip_by_rect(geoms, *clip_box)
+        features = [
+            {"geometry": geom, "properties": self.properties[i]}
+            for i, geom in zip(hits, geoms)
+            if not geom.is_empty
+        ]
+        return mapbox_vector_tile.encode(
+            [{"name": TILE_LAYER_NAME, "features": features}],
+            default_options={
+                "quantize_bounds": (minx, miny, maxx, maxy),
+                "extents": TILE_EXTENT,
+            },
+        )
+
+
+class TileServer:
+    """
+    Background HTTP server holding a registry of tile layers and a bounded
+    LRU cache of encoded tiles. Entries are keyed by
+    (name, token), so sessions showing different versions of the same name
+    each get their own layer, and a request whose ?v= token is not
+    registered gets a 404 rather than another version's data. The registry
+    is an LRU under a byte budget: registering (or re-registering) an entry
+    marks it as recently used, and the least recently used entries (stale
+    tokens first) are dropped, with their tiles, once the budget is
+    exceeded. The newest entry is always kept.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, max_bytes=REGISTRY_MAX_BYTES):
+        self.host = host
+        self.port = port
+        self.max_bytes = max_bytes
+        self._registry = OrderedDict()  # (name, token) -> (layer, size), oldest first
+        self._registry_bytes = 0
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self._httpd = None
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def register(self, name, gdf, properties, token=""):
+        """
+        Register a layer version and return its URL path template.
+        Re-registering with the same token is a no-op, so this is cheap to
+        call on every rerun.
+        """
+        key = (name, str(token))
+        if not self._touch(key):
+            layer = TileLayer(gdf, properties)
+            self._put(key, layer, layer.nbytes)
+        return f"/{quote(name, safe='')}/{{z}}/{{x}}/{{y}}.pbf?v={quote(key[1], safe='')}"
+
+    def _touch(self, key):
+        """
+        Mark a registered entry as recently used; False if it is missing.
+        """
+        with self._lock:
+            if key not in self._registry:
+                return False
+            self._registry.move_to_end(key)
+            return True
+
+    def _put(self, key, layer, size):
+        with self._lock:
+            self._drop(key)
+            self._registry[key] = (layer, size)
+            self._registry_bytes += size
+            while self._registry_bytes > self.max_bytes and len(self._registry) > 1:
+                self._drop(next(iter(self._registry)))
+
+    def _drop(self, key):
+        # (called with the lock held)
+        entry = self._registry.pop(key, None)
+        if entry is None:
+            return
+        self._registry_bytes -= entry[1]
+        for tile_key in [k for k in self._tiles if k[:2] == key]:
+            del self._tiles[tile_key]
+
+    def _get(self, name, token):
+        with self._lock:
+            entry = self._registry.get((name, token))
+        return None if entry is None else entry[0]
+
+    def tile(self, name, token, z, x, y):
+        """
+        Encoded tile bytes, or None if the layer version is unknown.
+        """
+        key = (name, token, z, x, y)
+        with self._lock:
+            cached = self._tiles.get(key)
+            if cached is not None:
+                self._tiles.move_to_end(key)
+                return cached
+        layer = self._get(name, token)
+        if layer is None:
+            return None
+
+        data = layer.encode(z, x, y)
+        with self._lock:
+            entry = self._registry.get((name, token))
+            if entry is not None and entry[0] is layer:
+                self._tiles[key] = data
+                if len(self._tiles) > TILE_CACHE_SIZE:
+                    self._tiles.popitem(last=False)
+        return data
+
+    def _handle(self, request):
+        path, _, query = request.path.partition("?")
+        parts = path.strip("/").split("/")
+        token = parse_qs(query).get("v", [""])[0]
+        if parts == [""]:
+            request.send_response(204)
+            request.send_header("Access-Control-Allow-Origin", "*")
+            request.send_header("Cache-Control", "no-store")
+            request.end_headers()
+            return
+        try:
+            name, z, x = unquote(parts[0]), int(parts[1]), int(parts[2])
+            y = int(parts[3].split(".", 1)[0])
+            if len(parts) != 4 or not 0 <= z <= 24 or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+                raise ValueError
+        except (IndexError, ValueError):
+            request.send_error(400, "Expected /<layer>/<z>/<x>/<y>.pbf")
+            return
+
+        data = self.tile(name, token, z, x, y)
+        if data is None:
+            request.send_error(404, f"Unknown layer '{name}' (v={token})")
+            return
+
+        request.send_response(200)
+        request.send_header("Content-Type", "application/x-protobuf")
+        request.send_header("Content-Length", str(len(data)))
+        request.send_header("Access-Control-Allow-Origin", "*")
+        request.send_header("Cache-Control", "public, max-age=86400")
+        request.end_headers()
+        request.wfile.write(data)
+
+
+# -------------------------------------------------------------------
+# Client side: reachability check
+# -------------------------------------------------------------------
+class TileServerCheck(MacroElement):
+    """
+    Probes the tile server from the browser and shows a notice on the map
+    when it cannot be reached (wrong TILE_SERVER_URL, port not exposed,
+    http tiles blocked on an https page). Leaflet.VectorGrid itself fails
+    silently and leaves the map empty.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            fetch({{ this.url|tojson }}, {cache: "no-store"})
+                .then(function(response) {
+                    if (!response.ok) { throw new Error("HTTP " + response.status); }
+                })
+                .catch(function(error) {
+                    console.error("Tile server not reachable at " + {{ this.url|tojson }}, error);
+                    {{ this.notice_js(this._parent.get_name()) }}
+                });
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, server_url):
+        super().__init__()
+        self._name = "TileServerCheck"
+        self.url = server_url.rstrip("/") + "/"
+
+    @staticmethod
+    def notice_js(map_name):
+        return map_notice_js(
+            map_name,
+            '"Vector tiles unavailable (" + error.message + "). Set TILE_SERVER_URL or send map layers as GeoJSON."',
+        )
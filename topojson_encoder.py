@@ -0,0 +1,235 @@
+# -------------------------------------------------------------------
+# TopoJSON encoder for polygon layers
+# -------------------------------------------------------------------
+# Adjacent counties share their boundary edges. GeoJSON repeats every shared
+# edge once per polygon at full float precision; TopoJSON stores each edge
+# once as an "arc", on a quantized integer grid, with delta-encoded
+# coordinates. folium.TopoJson renders the result directly.
+
+import folium
+
+from jinja2 import Template
+import numpy as np
+import pandas as pd
+import shapely
+
+DEFAULT_QUANTIZATION = 100_000
+
+
+def _quantize(coords, bounds, quantization):
+    """
+    Map lon/lat coordinates onto an integer grid of quantization^2 cells.
+    Returns the integer coordinates plus the TopoJSON transform.
+    """
+    minx, miny, maxx, maxy = bounds
+    kx = (maxx - minx) / (quantization - 1) or 1.0
+    ky = (maxy - miny) / (quantization - 1) or 1.0
+    grid = np.empty(coords.shape, dtype=np.int64)
+    grid[:, 0] = np.round((coords[:, 0] - minx) / kx)
+    grid[:, 1] = np.round((coords[:, 1] - miny) / ky)
+    return grid, {"scale": [kx, ky], "translate": [minx, miny]}
+
+
+def _ring_points(geometries, quantization):
+    """
+    Flatten all polygon rings into quantized points.
+    Returns (points, ring_starts, ring_lengths, ring_feature,
+    ring_is_exterior, transform). Rings have their closing point and
+    consecutive duplicates (after quantization) removed.
+    """
+    parts, part_feature = shapely.get_parts(geometries, return_index=True)
+    is_polygon = shapely.get_type_id(parts) == 3
+    parts, part_feature = parts[is_polygon], part_feature[is_polygon]
+
+    rings, ring_part = shapely.get_rings(parts, return_index=True)
+    exterior = np.r_[True, ring_part[1:] != ring_part[:-1]] if len(rings) else np.zeros(0, bool)
+    coords, point_ring = shapely.get_coordinates(rings, return_index=True)
+    if len(coords) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return np.zeros((0, 2), np.int64), empty, empty, empty, empty.astype(bool), None
+
+    grid, transform = _quantize(coords, shapely.total_bounds(rings), quantization)
+
+    # Drop the closing point and repeated points within each ring
+    first_of_ring = np.r_[True, point_ring[1:] != point_ring[:-1]]
+    last_of_ring = np.r_[point_ring[1:] != point_ring[:-1], True]
+    repeated = np.r_[False, (grid[1:] == grid[:-1]).all(axis=1)] & ~first_of_ring
+    keep = ~repeated & ~last_of_ring
+    grid, point_ring = grid[keep], point_ring[keep]
+
+    ring_ids, ring_starts, ring_lengths = np.unique(point_ring, return_index=True, return_counts=True)
+    ring_feature = part_feature[ring_part[ring_ids]]
+    return (
+        grid,
+        ring_starts,
+        ring_lengths,
+        ring_feature,
+        exterior[ring_ids],
+        transform,
+    )
+
+
+def _junctions(points, ring_starts, ring_lengths):
+    """
+    Boolean mask of junction points: points whose neighbours differ between
+    the rings passing through them (where a shared boundary starts or ends).
+    """
+    offsets = np.arange(len(points)) - np.repeat(ring_starts, ring_lengths)
+    lengths = np.repeat(ring_lengths, ring_lengths)
+    starts = np.repeat(ring_starts, ring_lengths)
+    prev_idx = starts + (offsets - 1) % lengths
+    next_idx = starts + (offsets + 1) % lengths
+
+    width = np.int64(points[:, 1].max() + 1) if len(points) else 1
+    keys = points[:, 0] * width + points[:, 1]
+    prev_keys, next_keys = keys[prev_idx], keys[next_idx]
+    pairs = pd.DataFrame({
+        "key": keys,
+        "lo": np.minimum(prev_keys, next_keys),
+        "hi": np.maximum(prev_keys, next_keys),
+    }).drop_duplicates()
+    neighbour_sets = pairs.groupby("key").size()
+    junction_keys = neighbour_sets.index[neighbour_sets.to_numpy() > 1].to_numpy()
+    return np.isin(keys, junction_keys), keys
+
+
+def encode_topology(gdf, object_name="features", properties=None, quantization=DEFAULT_QUANTIZATION):
+    """
+    Encode a polygon GeoDataFrame (lon/lat) as a quantized TopoJSON dict.
+    - Shared boundaries become a single arc referenced by both polygons
+      (the second one walks it in reverse, as ~index).
+    - Arc coordinates are delta-encoded integers; 'transform' maps them back.
+    - properties: columns to keep on each geometry (default: all but geometry).
+    Non-polygon geometries are dropped.
+    """
+    geometries = np.asarray(gdf.geometry.values, dtype=object)
+    if properties is None:
+        properties = [col for col in gdf.columns if col != gdf.geometry.name]
+    records = (
+        gdf[properties].astype(object).where(gdf[properties].notna(), None).to_dict(orient="records")
+    )
+
+    points, ring_starts, ring_lengths, ring_feature, ring_exterior, transform = (
+        _ring_points(geometries, quantization)
+    )
+    is_junction, keys = _junctions(points, ring_starts, ring_lengths)
+
+    arcs = []
+    arc_index = {}
+
+    def add_arc(arc_points):
+        forward = arc_points.tobytes()
+        index = arc_index.get(forward)
+        if index is not None:
+            return index
+        index = arc_index.get(arc_points[::-1].tobytes())
+        if index is not None:
+            return ~index
+        arc_index[forward] = len(arcs)
+        arcs.append(arc_points)
+        return len(arcs) - 1
+
+    feature_polygons = [[] for _ in range(len(gdf))]
+    skip_holes = False
+    for start, length, feature, exterior in zip(ring_starts, ring_lengths, ring_feature, ring_exterior):
+        # Rings collapsed by quantization are dropped; a collapsed exterior
+        # takes its holes along
+        if exterior:
+            skip_holes = length < 3
+        if length < 3 or skip_holes:
+            continue
+        ring = points[start:start + length]
+        ring_junctions = np.flatnonzero(is_junction[start:start + length])
+
+        if len(ring_junctions) == 0:
+            # Closed ring with no shared endpoints: rotate to a canonical start
+            # so identical rings (e.g. a hole and the island filling it) match
+            first = int(np.argmin(keys[start:start + length]))
+            rotated = np.roll(ring, -first, axis=0)
+            ring_arcs = [add_arc(np.vstack([rotated, rotated[:1]]))]
+        else:
+            rotated = np.roll(ring, -ring_junctions[0], axis=0)
+            cuts = list(ring_junctions - ring_junctions[0]) + [length]
+            closed = np.vstack([rotated, rotated[:1]])
+            ring_arcs = [add_arc(closed[a:b + 1]) for a, b in zip(cuts[:-1], cuts[1:])]
+
+        if exterior:
+            feature_polygons[feature].append([ring_arcs])
+        else:
+            feature_polygons[feature][-1].append(ring_arcs)
+
+    topo_geometries = []
+    for polygons, record in zip(feature_polygons, records):
+        if not polygons:
+            topo_geometries.append({"type": None, "properties": record})
+        elif len(polygons) == 1:
+            topo_geometries.append({"type": "Polygon", "arcs": polygons[0], "properties": record})
+        else:
+            topo_geometries.append({"type": "MultiPolygon", "arcs": polygons, "properties": record})
+
+    encoded_arcs = []
+    for arc in arcs:
+        deltas = np.vstack([arc[:1], np.diff(arc, axis=0)])
+        encoded_arcs.append(deltas.tolist())
+
+    topology = {
+        "type": "Topology",
+        "objects": {object_name: {"type": "GeometryCollection", "geometries": topo_geometries}},
+        "arcs": encoded_arcs,
+    }
+    if transform is not None:
+        topology["transform"] = transform
+        topology["bbox"] = list(shapely.total_bounds(geometries))
+    return topology
+
+
+class DataDrivenTopoJson(folium.TopoJson):
+    """
+    folium.TopoJson styled in the browser by a JavaScript style function of
+    each feature, instead of a Python style_function evaluated per feature
+    and written into every feature's properties.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }}_data = {{ this.data|tojson }};
+            var {{ this.get_name() }} = L.geoJson(
+                topojson.feature(
+                    {{ this.get_name() }}_data,
+                    {{ this.get_name() }}_data{{ this._safe_object_path }}
+                ),
+                {
+                {%- if this.smooth_factor is not none %}
+                    smoothFactor: {{ this.smooth_factor|tojson }},
+                {%- endif %}
+                    style: {{ this.style_js }}
+                }
+            ).addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, data, object_path, style, **kwargs):
+        super().__init__(data, object_path, **kwargs)
+        self.style_js = style
+
+    def style_data(self):
+        # Styling happens client-side; leave the feature properties untouched
+        pass
+
+
+def topology_layer(topology, object_name="features", style="function(feature) { return {}; }",
+                   tooltip=None, name=None):
+    """
+    Folium layer for an encoded topology, styled by a JavaScript function
+    of the feature (e.g. reading precomputed style properties). The
+    topology is embedded as-is, so cached topologies can be shared.
+    """
+    return DataDrivenTopoJson(
+        topology,
+        object_path=f"objects.{object_name}",
+        style=style,
+        tooltip=tooltip,
+        name=name,
+    )
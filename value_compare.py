@@ -0,0 +1,11 @@
+# -------------------------------------------------------------------
+# Value comparison shared by the version store and the version diff
+# -------------------------------------------------------------------
+import pandas as pd
+
+
+def same_values(left, right):
+    """
+    Element-wise equality of two object arrays, treating nulls as equal.
+    """
+    return (left == right) | (pd.isna(left) & pd.isna(right))
@@ -0,0 +1,115 @@
+# -------------------------------------------------------------------
+# Memory-bounded cache for opened versions
+# -------------------------------------------------------------------
+# Every version opened in the Versions tab stays in memory so that
+# switching back to it is instant. VersionCache keeps those frames under
+# a byte budget: each entry is charged its estimated in-memory size, and
+# the least-recently-used entries are evicted once the total exceeds the
+# budget. One instance is shared by every session of the process.
+import threading
+
+from collections import OrderedDict
+
+import numpy as np
+import shapely
+
+# GEOS memory per geometry object beyond its coordinates (calibrated
+# against process RSS growth when loading counties_0)
+GEOMETRY_OVERHEAD_BYTES = 192
+
+
+def frame_nbytes(gdf):
+    """
+    Estimated memory held by a (Geo)DataFrame: pandas' deep memory usage
+    for ordinary columns, plus coordinate storage and a per-object
+    overhead for geometry columns (pandas only sees their pointers).
+    """
+    total = 0
+    for col in gdf.columns:
+        values = gdf[col]
+        if values.dtype.name == "geometry":
+            geometries = np.asarray(values.array, dtype=object)
+            coordinates = shapely.get_num_coordinates(geometries).sum()
+            dimensions = 3 if shapely.has_z(geometries).any() else 2
+            parts = shapely.get_num_geometries(geometries).sum()
+            total += int(coordinates) * 8 * dimensions + (len(geometries) + int(parts)) * GEOMETRY_OVERHEAD_BYTES
+        else:
+            total += int(values.memory_usage(index=False, deep=True))
+    return total + int(gdf.index.memory_usage(deep=True))
+
+
+class VersionCache:
+    """
+    Thread-safe LRU cache of opened versions under a memory budget.
+    - get(key, load) -> cached value, or load() stored under key
+    - stats() -> entries, bytes, max_bytes, hits, misses, evictions
+    Entries larger than the whole budget are returned but not kept.
+    Callers must not modify returned frames (take a shallow copy first;
+    Copy-on-Write keeps the cached frame intact).
+    """
+
+    def __init__(self, max_bytes, sizeof=frame_nbytes):
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._entries = OrderedDict()  # key -> (value, size), oldest first
+        self._bytes = 0
+        self._hits = self._misses = self._evictions = 0
+        self._lock = threading.Lock()
+        self._loading = {}  # key -> lock held while the key is being loaded
+
+    def get(self, key, load):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[0]
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        # One load per key at a time: concurrent sessions opening the same
+        # version wait for the first load instead of repeating it
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return entry[0]
+                self._misses += 1
+            try:
+                value = load()
+                self._store(key, value, self._sizeof(value))
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+        return value
+
+    def _store(self, key, value, size):
+        with self._lock:
+            if size > self.max_bytes:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
@@ -0,0 +1,200 @@
+# -------------------------------------------------------------------
+# Version catalog
+# -------------------------------------------------------------------
+# One SQLite row per saved version: name, timestamp, states touched,
+# feature count, bounding box, file size and content hash. The version
+# writer records a row as soon as a version file is in place, so the
+# Versions tab can list, filter, sort and paginate any number of versions
+# with indexed queries instead of listing and parsing the folder.
+# Versions saved before the catalog existed (or copied in by hand) are
+# picked up by sync(), which reads each unknown file once.
+import contextlib
+import math
+import os
+import sqlite3
+
+from datetime import datetime
+
+from export_cache import file_digest
+from version_store import DELTA_SUFFIX, FGB_SUFFIX, is_version_file, version_stem
+
+CATALOG_FILE = "catalog.sqlite"
+TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+# Versions tab sort options -> ORDER BY clause
+SORT_ORDERS = {
+    "Newest first": "created DESC, file DESC",
+    "Oldest first": "created ASC, file ASC",
+    "Name (A-Z)": "name COLLATE NOCASE ASC, created DESC",
+    "Most features": "feature_count DESC, created DESC",
+    "Largest file": "size DESC, created DESC",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    file TEXT PRIMARY KEY,          -- file name inside the version folder
+    name TEXT NOT NULL,
+    created TEXT NOT NULL,          -- ISO 8601, sorts chronologically
+    states TEXT NOT NULL,           -- ',06,48,' (delimited for LIKE filters)
+    feature_count INTEGER NOT NULL,
+    minx REAL, miny REAL, maxx REAL, maxy REAL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    format TEXT NOT NULL            -- 'delta', 'flatgeobuf' or 'geojson'
+);
+CREATE INDEX IF NOT EXISTS versions_created ON versions (created);
+CREATE INDEX IF NOT EXISTS versions_name ON versions (name COLLATE NOCASE);
+"""
+
+
+def parse_version_filename(file_name):
+    """
+    (name, created) from 'someName_YYYYMMDD_HHMMSS.<suffix>'; created is
+    None when the name has no timestamp.
+    """
+    parts = version_stem(file_name).rsplit("_", 2)
+    if len(parts) == 3:
+        try:
+            return parts[0], datetime.strptime(f"{parts[1]}_{parts[2]}", TIMESTAMP_FORMAT)
+        except ValueError:
+            pass
+    return version_stem(file_name), None
+
+
+def proposed_states(gdf):
+    """
+    States with drawn polygons in a version (rows named '... (Proposed)').
+    """
+    if "NAME" not in gdf.columns or "STATEFP" not in gdf.columns:
+        return []
+    proposed = gdf["NAME"].astype(str).str.endswith("(Proposed)")
+    return sorted(gdf.loc[proposed, "STATEFP"].dropna().astype(str).unique())
+
+
+class VersionCatalog:
+    """
+    SQLite catalog of saved versions. Each call uses its own connection,
+    so one instance can be shared by the writer thread and every session.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def record(self, version_path, gdf, name, created, states, file_format=None):
+        """
+        Add or replace the entry for a version file that is in place.
+        created: datetime; states: iterable of STATEFP codes.
+        """
+        minx, miny, maxx, maxy = (
+            [None] * 4 if gdf.empty else [None if math.isnan(v) else float(v) for v in gdf.total_bounds]
+        )
+        if file_format is None:
+            file_format = (
+                "delta" if version_path.endswith(DELTA_SUFFIX)
+                else "flatgeobuf" if version_path.endswith(FGB_SUFFIX)
+                else "geojson"
+            )
+        entry = (
+            os.path.basename(version_path),
+            name,
+            created.isoformat(timespec="seconds"),
+            "," + ",".join(sorted(set(states))) + "," if states else "",
+            len(gdf),
+            minx, miny, maxx, maxy,
+            os.path.getsize(version_path),
+            file_digest(version_path),
+            file_format,
+        )
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", entry)
+
+    def remove(self, files):
+        with self._connect() as db:
+            db.executemany("DELETE FROM versions WHERE file = ?", [(file,) for file in files])
+
+    @staticmethod
+    def _filter(search, states):
+        where, params = [], []
+        if search:
+            escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            where.append("name LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        if states:
+            where.append("(" + " OR ".join("states LIKE ?" for _ in states) + ")")
+            params.extend(f"%,{state},%" for state in states)
+        return (f" WHERE {' AND '.join(where)}" if where else ""), params
+
+    def count(self, search="", states=()):
+        """
+        Number of entries matching a name search and any of the states.
+        """
+        clause, params = self._filter(search, states)
+        with self._connect() as db:
+            return db.execute(f"SELECT COUNT(*) FROM versions{clause}", params).fetchone()[0]
+
+    def query(self, search="", states=(), sort="Newest first", limit=25, offset=0):
+        """
+        One page of entries (dicts) matching a name search and any of the
+        given states, in a SORT_ORDERS order.
+        """
+        clause, params = self._filter(search, states)
+        with self._connect() as db:
+            rows = db.execute(
+                f"SELECT * FROM versions{clause} ORDER BY {SORT_ORDERS[sort]} LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def states(self):
+        """
+        Every state code touched by some version.
+        """
+        with self._connect() as db:
+            rows = db.execute("SELECT DISTINCT states FROM versions").fetchall()
+        return sorted({state for (states,) in rows for state in states.split(",") if state})
+
+    def files(self):
+        with self._connect() as db:
+            return {file for (file,) in db.execute("SELECT file FROM versions")}
+
+    def sync(self, folder, read):
+        """
+        Reconcile the catalog with the version files in folder: drop
+        entries whose file is gone and record files it does not know,
+        reading each with read(path). Name and timestamp come from the
+        file name (falling back to the file's mtime), states touched from
+        its proposed polygons. Returns (added, removed) counts.
+        """
+        on_disk = {name for name in os.listdir(folder) if is_version_file(name)} if os.path.isdir(folder) else set()
+        known = self.files()
+        removed = known - on_disk
+        if removed:
+            self.remove(removed)
+
+        added = 0
+        for file in sorted(on_disk - known):
+            path = os.path.join(folder, file)
+            try:
+                gdf = read(path)
+            except Exception:
+                # Unreadable file: leave it out of the catalog
+                continue
+            name, created = parse_version_filename(file)
+            if created is None:
+                created = datetime.fromtimestamp(os.path.getmtime(path))
+            self.record(path, gdf, name, created, proposed_states(gdf))
+            added += 1
+        return added, len(removed)
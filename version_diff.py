@@ -0,0 +1,167 @@
+# -------------------------------------------------------------------
+# Version diff
+# -------------------------------------------------------------------
+# Compares two saved versions feature by feature. Every feature gets an
+# identity key: its GEOID, else NAME + STATEFP (drawn polygons), else a
+# hash of its geometry; repeated keys within a version (several polygons
+# drawn for one county) are numbered in row order. Features are matched
+# on those keys and compared in bulk: one 64-bit hash per row (geometry
+# WKB + compared attributes) skips every unchanged feature, and only the
+# rows whose hashes differ are compared column by column. Two files with
+# the same catalog hash are not opened at all.
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from value_compare import same_values
+
+DIFF_ATTRIBUTES = ["NAME", "color", "SalesRep", "Product"]
+CHANGE_KINDS = ["added", "removed", "geometry", "restyled"]
+DIFF_COLUMNS = ["key", "change", "NAME", "STATEFP", "color_before", "color_after", "changed"]
+
+
+def geometry_hashes(geometries):
+    """
+    64-bit hash of each geometry's WKB (equal for identical geometries).
+    """
+    return pd.util.hash_array(np.asarray(shapely.to_wkb(geometries), dtype=object))
+
+
+def diff_keys(gdf, geometry_hash=None):
+    """
+    Identity key per row: GEOID, else 'name:<STATEFP>|<NAME>', else
+    'wkb:<geometry hash>', numbered ('#1', '#2', ...) when repeated.
+    """
+    keys = np.full(len(gdf), None, dtype=object)
+    if "GEOID" in gdf.columns:
+        geoids = gdf["GEOID"].astype(object).to_numpy()
+        present = ~pd.isna(geoids)
+        keys[present] = geoids[present]
+
+    missing = pd.isna(keys)
+    if missing.any() and "NAME" in gdf.columns:
+        names = gdf["NAME"].astype(object).to_numpy()
+        states = gdf["STATEFP"].astype(object).to_numpy() if "STATEFP" in gdf.columns else keys
+        named = missing & ~pd.isna(names)
+        keys[named] = [f"name:{state}|{name}" for state, name in zip(states[named], names[named])]
+        missing = pd.isna(keys)
+
+    if missing.any():
+        hashes = geometry_hash[missing] if geometry_hash is not None else geometry_hashes(gdf.geometry.values[missing])
+        keys[missing] = [f"wkb:{value:016x}" for value in hashes]
+
+    occurrence = pd.Series(keys).groupby(keys, sort=False).cumcount().to_numpy()
+    repeated = occurrence > 0
+    keys[repeated] = [f"{key}#{count}" for key, count in zip(keys[repeated], occurrence[repeated])]
+    return keys
+
+
+def _keyed(gdf, attributes):
+    """
+    Frame indexed by identity key: compared attributes (None where the
+    version lacks the column), STATEFP, geometry, and the per-row hashes.
+    """
+    geometry_hash = geometry_hashes(gdf.geometry.values)
+    frame = pd.DataFrame(
+        {
+            col: gdf[col].astype(object).to_numpy() if col in gdf.columns else np.full(len(gdf), None, dtype=object)
+            for col in attributes + ["STATEFP"]
+        },
+        index=pd.Index(diff_keys(gdf, geometry_hash), name="key"),
+    )
+    frame = frame.where(frame.notna(), None)
+    frame["geometry"] = gdf.geometry.values
+    frame["geometry_hash"] = geometry_hash
+    frame["row_hash"] = pd.util.hash_pandas_object(frame[attributes], index=False).to_numpy() ^ geometry_hash
+    return frame
+
+
+def empty_diff(crs=None):
+    return gpd.GeoDataFrame(
+        {col: pd.Series(dtype=object) for col in DIFF_COLUMNS}, geometry=gpd.GeoSeries([], crs=crs), crs=crs
+    )
+
+
+def diff_versions(old, new, attributes=DIFF_ATTRIBUTES):
+    """
+    Features that differ between two versions, one row each:
+    - change: 'added', 'removed', 'geometry' (geometry changed, possibly
+      attributes too) or 'restyled' (attributes only)
+    - changed: the attribute columns that differ (comma-separated)
+    - color_before / color_after, NAME and STATEFP (new side, old side
+      for removed features)
+    - geometry: the new geometry (the old one for removed features)
+    Rows are ordered by change kind, then by position in the version.
+    """
+    attributes = list(attributes)
+    before, after = _keyed(old, attributes), _keyed(new, attributes)
+
+    common = before.index.intersection(after.index, sort=False)
+    removed = before.index.difference(after.index, sort=False)
+    added = after.index.difference(before.index, sort=False)
+
+    # Unchanged features (same row hash) are skipped before any comparison
+    old_common, new_common = before.loc[common], after.loc[common]
+    candidates = old_common["row_hash"].to_numpy() != new_common["row_hash"].to_numpy()
+    old_common, new_common = old_common[candidates], new_common[candidates]
+
+    attribute_changes = ~same_values(
+        old_common[attributes].to_numpy(dtype=object), new_common[attributes].to_numpy(dtype=object)
+    )
+    geometry_changed = old_common["geometry_hash"].to_numpy() != new_common["geometry_hash"].to_numpy()
+    modified = geometry_changed | attribute_changes.any(axis=1)
+    changed_columns = np.array([
+        ", ".join(col for col, differs in zip(attributes, row) if differs) for row in attribute_changes
+    ], dtype=object)
+
+    def part(frame, change, color_before, color_after, changed=None):
+        return pd.DataFrame({
+            "key": frame.index.to_numpy(dtype=object),
+            "change": change,
+            "NAME": frame["NAME"].to_numpy(dtype=object),
+            "STATEFP": frame["STATEFP"].to_numpy(dtype=object),
+            "color_before": color_before,
+            "color_after": color_after,
+            "changed": changed if changed is not None else "",
+            "geometry": frame["geometry"].to_numpy(),
+        })
+
+    new_modified = new_common[modified]
+    parts = [
+        part(before.loc[removed], "removed", before.loc[removed, "color"].to_numpy(dtype=object), None),
+        part(after.loc[added], "added", None, after.loc[added, "color"].to_numpy(dtype=object)),
+        part(
+            new_modified,
+            np.where(geometry_changed[modified], "geometry", "restyled"),
+            old_common["color"].to_numpy(dtype=object)[modified],
+            new_modified["color"].to_numpy(dtype=object),
+            changed_columns[modified],
+        ),
+    ]
+    parts = [p for p in parts if len(p)]
+    if not parts:
+        return empty_diff(new.crs)
+    diff = pd.concat(parts, ignore_index=True)
+    order = np.argsort(pd.Categorical(diff["change"], categories=CHANGE_KINDS).codes, kind="stable")
+    diff = diff.take(order).reset_index(drop=True)
+    return gpd.GeoDataFrame(diff, geometry="geometry", crs=new.crs)
+
+
+def diff_version_files(old_path, new_path, read, old_digest=None, new_digest=None):
+    """
+    diff_versions for two version files read with read(path). When both
+    content hashes are known (e.g. from the version catalog) and equal,
+    the result is empty without reading either file.
+    """
+    if old_digest is not None and old_digest == new_digest:
+        return empty_diff()
+    return diff_versions(read(old_path), read(new_path))
+
+
+def diff_summary(diff):
+    """
+    Number of features per change kind.
+    """
+    counts = diff["change"].value_counts()
+    return {kind: int(counts.get(kind, 0)) for kind in CHANGE_KINDS}
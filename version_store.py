@@ -0,0 +1,477 @@
+# -------------------------------------------------------------------
+# Version persistence
+# -------------------------------------------------------------------
+# Writing a large version as GeoJSON takes seconds. VersionWriter moves
+# the write off the Streamlit script thread: saves are queued and written
+# one at a time by a background thread, each to a hidden temporary file
+# in the target folder that is atomically renamed into place once
+# complete. A version file therefore either does not exist yet or is
+# whole; the UI polls job status to show saves that are still running.
+#
+# New versions are saved as deltas against the base county layer instead
+# of full GeoJSON copies (see encode_delta). The base is referenced by the
+# SHA-256 of its source file and kept, once per distinct hash, as a
+# snapshot in the version folder's 'bases/' subfolder, so a delta stays
+# readable after the source file is replaced. Geometries of base
+# snapshots and of rows stored whole in deltas live in the folder's
+# content-addressed geometry store (see geometry_store.py); snapshots and
+# deltas hold their keys. read_version opens every format; full .geojson
+# versions and format 1 deltas remain readable as before.
+#
+# Versions can also be saved as FlatGeobuf (.fgb): full copies, but with
+# a packed R-tree, so read_version_part can load only the features in a
+# bounding box (e.g. the map view or one state) without reading the rest.
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+
+from functools import lru_cache
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyogrio
+import shapely
+
+from export_cache import file_digest
+from geo_cache import CACHE_FOLDER, read_geojson_cached, source_signature
+from geometry_store import geometry_store_for
+from value_compare import same_values
+
+WRITE_QUEUE_SIZE = 16
+FINISHED_JOBS_KEPT = 100
+
+DELTA_SUFFIX = ".delta.json"
+FGB_SUFFIX = ".fgb"
+VERSION_SUFFIXES = (DELTA_SUFFIX, FGB_SUFFIX, ".geojson")
+# 1: rows stored whole as GeoJSON features, GeoParquet base snapshots
+# 2: rows stored whole as properties + geometry store keys
+DELTA_FORMAT_VERSION = 2
+BASE_FOLDER = "bases"
+GEOMETRY_KEY_COLUMN = "geometry_key"
+# Columns stored per row in a delta; every other column must match the base
+VERSION_ATTRIBUTES = ("color", "SalesRep", "Product")
+
+
+class VersionQueueFull(RuntimeError):
+    """
+    Raised by VersionWriter.submit when the write queue stays full.
+    """
+
+
+class VersionBaseMissing(LookupError):
+    """
+    Raised when a delta version's base snapshot is not available.
+    """
+
+
+def is_version_file(name):
+    """
+    True for saved version files of any format (not temp files).
+    """
+    return not name.startswith(".") and name.endswith(VERSION_SUFFIXES)
+
+
+def version_stem(name):
+    """
+    Version file name without its format suffix.
+    """
+    for suffix in VERSION_SUFFIXES:
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return os.path.splitext(name)[0]
+
+
+class VersionWriter:
+    """
+    Background writer for version files with a bounded queue.
+    - submit(gdf, version_file, write, entry) -> job id (returns immediately)
+    - status(job_id) -> job dict (state: queued / writing / done / failed)
+    - in_progress() -> jobs not finished yet, oldest first
+    With a catalog, each written version is recorded in it (see
+    version_catalog.py) once its file is in place.
+    """
+
+    def __init__(self, max_queue=WRITE_QUEUE_SIZE, catalog=None):
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._catalog = catalog
+        threading.Thread(target=self._run, name="version-writer", daemon=True).start()
+
+    def submit(self, gdf, version_file, write=None, entry=None, timeout=5):
+        """
+        Queue gdf to be written to version_file by write(gdf, version_file)
+        (default: full GeoJSON). entry holds the catalog fields the file
+        itself does not (name, created, states). The frame must not be
+        modified afterwards (Copy-on-Write frames are safe).
+        """
+        with self._lock:
+            job_id = next(self._ids)
+            self._jobs[job_id] = {
+                "id": job_id,
+                "file": version_file,
+                "state": "queued",
+                "features": len(gdf),
+                "submitted": time.time(),
+                "seconds": None,
+                "error": None,
+            }
+        try:
+            self._queue.put((job_id, gdf, version_file, write or write_geojson_atomic, entry), timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job_id]
+            raise VersionQueueFull("Too many saves in progress; try again shortly.")
+        return job_id
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def in_progress(self):
+        with self._lock:
+            return [dict(job) for job in self._jobs.values() if job["state"] in ("queued", "writing")]
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _run(self):
+        while True:
+            job_id, gdf, version_file, write, entry = self._queue.get()
+            self._update(job_id, state="writing")
+            started = time.perf_counter()
+            try:
+                write(gdf, version_file)
+                if self._catalog is not None and entry is not None:
+                    self._catalog.record(version_file, gdf, **entry)
+                self._update(job_id, state="done", seconds=time.perf_counter() - started)
+            except Exception as e:
+                self._update(job_id, state="failed", error=str(e), seconds=time.perf_counter() - started)
+            finally:
+                self._queue.task_done()
+                self._forget_finished()
+
+    def _forget_finished(self):
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job["state"] in ("done", "failed")]
+            for job_id in finished[:-FINISHED_JOBS_KEPT]:
+                del self._jobs[job_id]
+
+
+def _write_atomic(file_path, write, suffix=""):
+    """
+    Call write(temp_file) for a hidden temp file next to file_path, then
+    rename it into place (atomic on the same filesystem). suffix ends the
+    temp file name, for writers that pick a layout from the extension.
+    """
+    folder, name = os.path.split(file_path)
+    temp_file = os.path.join(folder, f".{name}.{os.getpid()}-{threading.get_ident()}.tmp{suffix}")
+    try:
+        write(temp_file)
+        os.replace(temp_file, file_path)
+    except Exception:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        raise
+
+
+def write_geojson_atomic(gdf, file_path):
+    """
+    Write gdf as a full GeoJSON version file, atomically.
+    """
+    _write_atomic(file_path, lambda temp_file: gdf.to_file(temp_file, driver="GeoJSON"))
+
+
+def write_flatgeobuf_atomic(gdf, file_path):
+    """
+    Write gdf as a FlatGeobuf version file with a spatial index,
+    atomically. (GDAL treats a path without the .fgb extension as a
+    folder of layers, hence the temp file suffix.)
+    """
+    _write_atomic(
+        file_path,
+        lambda temp_file: gdf.to_file(temp_file, driver="FlatGeobuf", SPATIAL_INDEX="YES"),
+        suffix=FGB_SUFFIX,
+    )
+
+
+def write_delta_version_atomic(gdf, file_path, base_file, cache_folder=CACHE_FOLDER):
+    """
+    Write gdf as a delta version against base_file, atomically. The base
+    snapshot for the file's current contents is stored first if missing.
+    """
+    folder = os.path.dirname(file_path)
+    store = geometry_store_for(folder)
+    digest, base_gdf = store_base(base_file, os.path.join(folder, BASE_FOLDER), store, cache_folder)
+    delta = encode_delta(gdf, base_gdf, {"file": os.path.basename(base_file), "sha256": digest}, store)
+
+    def write(temp_file):
+        with open(temp_file, "w", encoding="utf-8") as file:
+            json.dump(delta, file, separators=(",", ":"), default=_json_value)
+
+    _write_atomic(file_path, write)
+
+
+# -------------------------------------------------------------------
+# Base snapshots
+# -------------------------------------------------------------------
+_base_digests = {}
+
+
+def store_base(base_file, base_folder, store, cache_folder=CACHE_FOLDER):
+    """
+    (sha256, frame) of base_file's current contents, keeping a snapshot
+    of it as base_folder/<sha256>.parquet: its columns, with geometries
+    replaced by their keys in the geometry store. The digest is
+    recomputed only when the file's signature changes.
+    """
+    key = (os.path.abspath(base_file), source_signature(base_file))
+    digest = _base_digests.get(key)
+    if digest is None:
+        digest = _base_digests[key] = file_digest(base_file)
+
+    snapshot = os.path.join(base_folder, f"{digest}.parquet")
+    base_gdf = read_geojson_cached(base_file, cache_folder=cache_folder)
+    if not os.path.exists(snapshot):
+        os.makedirs(base_folder, exist_ok=True)
+        geometry = base_gdf.geometry.name
+        frame = pd.DataFrame(base_gdf.drop(columns=geometry))
+        frame[GEOMETRY_KEY_COLUMN] = store.put(base_gdf.geometry.values)
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            b"geometry": geometry.encode(),
+            b"crs": base_gdf.crs.to_string().encode() if base_gdf.crs else b"",
+        })
+        _write_atomic(snapshot, lambda temp_file: pq.write_table(table, temp_file))
+    return digest, base_gdf
+
+
+@lru_cache(maxsize=4)
+def load_base(digest, base_folder):
+    """
+    Base snapshot by content hash, with geometries from the geometry
+    store (format 1 snapshots are GeoParquet). Snapshots never change
+    once written, so they are cached for the life of the process.
+    """
+    snapshot = os.path.join(base_folder, f"{digest}.parquet")
+    if not os.path.exists(snapshot):
+        raise VersionBaseMissing(f"Base snapshot {digest[:12]} not found in {base_folder}.")
+    if GEOMETRY_KEY_COLUMN not in pq.read_schema(snapshot).names:
+        return gpd.read_parquet(snapshot)
+
+    table = pq.read_table(snapshot)
+    metadata = table.schema.metadata
+    frame = table.to_pandas()
+    geometries = geometry_store_for(os.path.dirname(base_folder)).get(frame.pop(GEOMETRY_KEY_COLUMN).tolist())
+    crs = metadata[b"crs"].decode() or None
+    frame[metadata[b"geometry"].decode()] = gpd.GeoSeries(geometries, index=frame.index, crs=crs)
+    return gpd.GeoDataFrame(frame, geometry=metadata[b"geometry"].decode(), crs=crs)
+
+
+# -------------------------------------------------------------------
+# Delta encoding
+# -------------------------------------------------------------------
+def _json_value(value):
+    """
+    JSON-compatible scalar: nulls become None, numpy scalars Python ones.
+    """
+    if value is None or (np.ndim(value) == 0 and pd.isna(value)):
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def encode_delta(gdf, base_gdf, base, store, attributes=VERSION_ATTRIBUTES):
+    """
+    Delta document for gdf against base_gdf (base: {'file', 'sha256'}).
+    A version row whose geometry (WKB) and non-attribute columns equal an
+    unused base row is stored as that base row's position; its attribute
+    columns are stored as per-column defaults plus the values that
+    differ. All other rows (drawn polygons, edited counties) are stored
+    whole: their columns, plus geometry keys in the geometry store (the
+    geometries are put there). Columns the base lacks count as attributes.
+    """
+    geometry = gdf.geometry.name
+    columns = [col for col in gdf.columns if col != geometry]
+    base_columns = set(base_gdf.columns) - {base_gdf.geometry.name}
+    attribute_columns = [col for col in columns if col in attributes or col not in base_columns]
+    shared_columns = [col for col in columns if col not in attribute_columns]
+
+    # Match rows to base rows by geometry; each base row is used at most once
+    base_positions = {}
+    for position, wkb in enumerate(shapely.to_wkb(base_gdf.geometry.values)):
+        if wkb is not None:
+            base_positions.setdefault(wkb, []).append(position)
+    matched = np.full(len(gdf), -1, dtype=np.int64)
+    for row, wkb in enumerate(shapely.to_wkb(gdf.geometry.values)):
+        candidates = base_positions.get(wkb)
+        if candidates:
+            matched[row] = candidates.pop(0)
+
+    # ...and only if every non-attribute column agrees with the base row
+    rows = np.flatnonzero(matched >= 0)
+    if shared_columns and len(rows):
+        same = same_values(
+            gdf[shared_columns].iloc[rows].astype(object).to_numpy(),
+            base_gdf[shared_columns].iloc[matched[rows]].astype(object).to_numpy(),
+        ).all(axis=1)
+        matched[rows[~same]] = -1
+        rows = rows[same]
+
+    is_added = matched < 0
+    order = np.where(is_added, ~(np.cumsum(is_added) - 1), matched)
+
+    defaults, changes = {}, {}
+    positions = matched[rows]
+    for col in attribute_columns:
+        values = gdf[col].iloc[rows].astype(object).to_numpy()
+        counts = pd.Series(values, dtype=object).value_counts(dropna=False)
+        default = counts.index[0] if len(counts) else None
+        differs = ~same_values(values, np.full(len(values), default, dtype=object))
+        defaults[col] = _json_value(default)
+        if differs.any():
+            changes[col] = {
+                str(position): _json_value(value)
+                for position, value in zip(positions[differs], values[differs])
+            }
+
+    added = gdf.loc[is_added, columns].astype(object)
+    return {
+        "format": "redistricting-version-delta",
+        "format_version": DELTA_FORMAT_VERSION,
+        "base": dict(base, features=len(base_gdf)),
+        "crs": gdf.crs.to_string() if gdf.crs else None,
+        "columns": list(gdf.columns),
+        "geometry": geometry,
+        "order": order.tolist(),
+        "defaults": defaults,
+        "changes": changes,
+        "added": {
+            "columns": columns,
+            "data": added.where(added.notna(), None).to_numpy().tolist(),
+            "geometry": store.put(gdf.geometry.values[is_added]),
+        },
+    }
+
+
+def _added_rows(delta, geometry, crs, store):
+    """
+    Rows a delta stores whole, as a GeoDataFrame.
+    """
+    added = delta["added"]
+    if delta["format_version"] == 1:
+        frame = gpd.GeoDataFrame.from_features(added["features"], crs=crs)
+        return frame.rename_geometry(geometry) if frame.geometry.name != geometry else frame
+    frame = pd.DataFrame(added["data"], columns=added["columns"])
+    frame[geometry] = gpd.GeoSeries(store.get(added["geometry"]), index=frame.index, crs=crs)
+    return gpd.GeoDataFrame(frame, geometry=geometry, crs=crs)
+
+
+def decode_delta(delta, base_gdf, store=None):
+    """
+    Materialize a delta document against its base frame (inverse of
+    encode_delta). Format 2 deltas need the geometry store they were
+    written with.
+    """
+    if delta.get("format_version") not in (1, DELTA_FORMAT_VERSION):
+        raise ValueError(f"Unsupported delta version format {delta.get('format_version')!r}.")
+    if len(base_gdf) != delta["base"]["features"]:
+        raise ValueError("Base snapshot does not match the delta's base.")
+    geometry = delta["geometry"]
+    order = np.asarray(delta["order"], dtype=np.int64)
+    from_base = order >= 0
+    positions = order[from_base]
+
+    rows = base_gdf.take(positions).reset_index(drop=True)
+    if rows.geometry.name != geometry:
+        rows = rows.rename_geometry(geometry)
+    row_of = {position: row for row, position in enumerate(positions.tolist())}
+    for col, default in delta["defaults"].items():
+        values = np.full(len(rows), default, dtype=object)
+        for position, value in delta["changes"].get(col, {}).items():
+            values[row_of[int(position)]] = value
+        rows[col] = values
+
+    added = _added_rows(delta, geometry, delta["crs"] or base_gdf.crs, store)
+
+    frame = pd.concat([rows, added], ignore_index=True)
+    take = np.empty(len(order), dtype=np.int64)
+    take[from_base] = np.arange(len(rows))
+    take[~from_base] = len(rows) + ~order[~from_base]
+    gdf = gpd.GeoDataFrame(frame.take(take).reset_index(drop=True), geometry=geometry, crs=frame.crs)
+    # Null-only columns of the added rows turn numeric and text columns into
+    # object on concat; infer them again
+    return gdf.reindex(columns=delta["columns"]).infer_objects()
+
+
+def read_delta(file_path):
+    """
+    Materialize a delta version file against its base snapshot.
+    """
+    with open(file_path, encoding="utf-8") as file:
+        delta = json.load(file)
+    folder = os.path.dirname(os.path.abspath(file_path))
+    base_gdf = load_base(delta["base"]["sha256"], os.path.join(folder, BASE_FOLDER))
+    return decode_delta(delta, base_gdf, geometry_store_for(folder))
+
+
+def read_version(file_path, cache_folder=CACHE_FOLDER):
+    """
+    Read a saved version of any format. Deltas are materialized against
+    their base snapshot; FlatGeobuf files are read directly; full
+    .geojson versions go through the columnar cache. The app keeps opened
+    versions in a memory-bounded cache (see version_cache.py).
+    """
+    if file_path.endswith(DELTA_SUFFIX):
+        return read_delta(file_path)
+    if file_path.endswith(FGB_SUFFIX):
+        return read_flatgeobuf(file_path)
+    return read_geojson_cached(file_path, cache_folder=cache_folder)
+
+
+def read_flatgeobuf(file_path, **kwargs):
+    """
+    pyogrio.read_dataframe for a FlatGeobuf version. The driver stores a
+    Polygon layer as MultiPolygon, so single-part MultiPolygons are turned
+    back into Polygons: the frame then matches the one that was saved (and
+    the same version saved in another format, e.g. for diffs).
+    """
+    gdf = pyogrio.read_dataframe(file_path, **kwargs)
+    geometries = gdf.geometry.values
+    single = (shapely.get_type_id(geometries) == shapely.GeometryType.MULTIPOLYGON) & (
+        shapely.get_num_geometries(geometries) == 1
+    )
+    if single.any():
+        geometries = np.asarray(geometries, dtype=object).copy()
+        geometries[single] = shapely.get_geometry(geometries[single], 0)
+        gdf[gdf.geometry.name] = gpd.GeoSeries(geometries, index=gdf.index, crs=gdf.crs)
+    return gdf
+
+
+def supports_partial_reads(file_path):
+    return file_path.endswith(FGB_SUFFIX)
+
+
+def read_version_part(file_path, bbox=None, states=None):
+    """
+    Features of a FlatGeobuf version intersecting bbox (minx, miny, maxx,
+    maxy) and, if given, in states (STATEFP codes). Only the index nodes
+    and features inside bbox are read; the states filter is applied to
+    those. Without either filter the whole version is read.
+    """
+    where = None
+    if states:
+        codes = ", ".join("'{}'".format(str(code).replace("'", "''")) for code in states)
+        where = f"STATEFP IN ({codes})"
+    return read_flatgeobuf(file_path, bbox=tuple(bbox) if bbox else None, where=where)